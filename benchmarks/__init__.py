@@ -0,0 +1,18 @@
+"""
+Offline benchmarks of the Saline events processing
+
+Run all of them with:
+
+    python -m benchmarks
+
+or the selected ones with ``--only parser merger``, see ``--help``.
+
+The end-to-end throughput test runs the Saline processes reading the events
+from the stand-in Salt Event Bus publisher, see ``--help`` of:
+
+    python -m benchmarks.pipeline
+
+The scaling of the merging rules discovery of the smart merger is measured with:
+
+    python -m benchmarks.smart
+"""
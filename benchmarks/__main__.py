@@ -0,0 +1,75 @@
+import argparse
+import logging
+
+from benchmarks.generator import EventsGenerator
+from benchmarks.runner import BENCHMARKS, HEADER, get_opts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Run the offline benchmarks of the Saline events processing",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="The random seed")
+    parser.add_argument(
+        "--minions", type=int, default=100, help="The number of minions"
+    )
+    parser.add_argument(
+        "--states", type=int, default=50, help="The number of states per highstate"
+    )
+    parser.add_argument("--jobs", type=int, default=5, help="The number of jobs")
+    parser.add_argument(
+        "--trimmed-ratio",
+        type=float,
+        default=0.01,
+        help="The part of the state results with the trimmed values",
+    )
+    parser.add_argument(
+        "--smart-values",
+        type=int,
+        default=200,
+        help="The number of the state IDs to pass to the smart merger",
+    )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=list(BENCHMARKS),
+        default=list(BENCHMARKS),
+        help="Run the selected benchmarks only",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Skip the pass measuring the peak memory usage",
+    )
+    args = parser.parse_args()
+
+    # The warnings about the trimmed values in the events are expected
+    logging.getLogger("saline").setLevel(logging.ERROR)
+
+    events = list(
+        EventsGenerator(
+            seed=args.seed,
+            minions=args.minions,
+            states=args.states,
+            jobs=args.jobs,
+            trimmed_ratio=args.trimmed_ratio,
+        ).events()
+    )
+    opts = get_opts()
+
+    print(
+        "%d events: %d minions, %d states, %d jobs, seed %d"
+        % (len(events), args.minions, args.states, args.jobs, args.seed)
+    )
+    print(HEADER)
+    for name in args.only:
+        kwargs = {"values": args.smart_values} if name == "smart" else {}
+        print(
+            BENCHMARKS[name](events, opts, trace_memory=not args.no_memory, **kwargs),
+            flush=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
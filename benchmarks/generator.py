@@ -0,0 +1,201 @@
+import random
+
+from datetime import datetime, timedelta
+
+
+class EventsGenerator:
+    """
+    Seeded generator of the Salt events similar to the ones
+    captured from the Salt Event Bus of the Salt Master
+    """
+
+    STATE_FUNS = (
+        ("pkg", "installed"),
+        ("file", "managed"),
+        ("service", "running"),
+        ("cmd", "run"),
+        ("user", "present"),
+    )
+
+    def __init__(
+        self,
+        seed=0,
+        minions=100,
+        states=50,
+        jobs=10,
+        trimmed_ratio=0.01,
+        start=datetime(2023, 4, 18, 10, 0, 0),
+    ):
+        """
+        Create the events generator
+
+        :param int seed: The seed of the random values
+        :param int minions: The number of minions returning each job
+        :param int states: The number of states in each highstate return
+        :param int jobs: The number of jobs to generate
+        :param float trimmed_ratio: The part of the state results
+            with the trimmed changes
+        :param datetime start: The time of the first event
+        """
+
+        self._rand = random.Random(seed)
+        self.minions = ["minion%05d.example.org" % i for i in range(minions)]
+        self.states = states
+        self.jobs = jobs
+        self.trimmed_ratio = trimmed_ratio
+        self._now = start
+        self._sls = [
+            "packages.packages_%d" % i for i in range(max(states // 10, 1))
+        ] + ["util.sync_%d" % i for i in range(3)] + ["services/web_%d" % i for i in range(3)]
+
+    def _tick(self, ms=1):
+        self._now += timedelta(milliseconds=self._rand.randint(0, ms))
+        return self._now
+
+    def _stamp(self):
+        return self._tick().isoformat()
+
+    def _jid(self):
+        return "{:%Y%m%d%H%M%S%f}".format(self._tick(1000))
+
+    def _state_result(self, idx):
+        mod, fun = self.STATE_FUNS[idx % len(self.STATE_FUNS)]
+        sid = "%s_%d" % (mod, idx)
+        name = "/etc/%s/%d.conf" % (mod, idx) if mod == "file" else "%s%d" % (mod, idx)
+        result = self._rand.choices((True, False, None), (90, 5, 5))[0]
+        changes = {}
+        if self._rand.random() < 0.1:
+            changes = {"diff": "\n".join("+line %d" % i for i in range(20))}
+        if self._rand.random() < self.trimmed_ratio:
+            changes = "VALUE_TRIMMED"
+        ret = {
+            "name": name,
+            "changes": changes,
+            "result": result,
+            "comment": "The state %s was applied" % sid,
+            "__sls__": self._sls[idx % len(self._sls)],
+            "__run_num__": idx,
+            "start_time": "10:00:00.000000",
+            "duration": round(self._rand.uniform(0.1, 3000), 3),
+            "__id__": sid,
+        }
+        if self._rand.random() < 0.01:
+            ret["warnings"] = ["The state %s is deprecated" % sid]
+        return "%s_|-%s_|-%s_|-%s" % (mod, sid, name, fun), ret
+
+    def highstate(self):
+        """
+        Generate the events of one highstate job: the new job event
+        and the returns from all of the minions
+        """
+
+        jid = self._jid()
+        yield "salt/job/%s/new" % jid, {
+            "jid": jid,
+            "tgt_type": "list",
+            "tgt": self.minions,
+            "user": "admin",
+            "fun": "state.apply",
+            "arg": [],
+            "minions": self.minions,
+            "missing": [],
+            "_stamp": self._stamp(),
+        }
+        for minion in self.minions:
+            ret = dict(self._state_result(i) for i in range(self.states))
+            yield "salt/job/%s/ret/%s" % (jid, minion), {
+                "cmd": "_return",
+                "id": minion,
+                "success": True,
+                "return": ret,
+                "retcode": 0 if all(r["result"] for r in ret.values()) else 2,
+                "jid": jid,
+                "fun": "state.apply",
+                "fun_args": [],
+                "out": "highstate",
+                "_stamp": self._stamp(),
+            }
+
+    def ping(self):
+        jid = self._jid()
+        yield "salt/job/%s/new" % jid, {
+            "jid": jid,
+            "tgt_type": "glob",
+            "tgt": "*",
+            "user": "admin",
+            "fun": "test.ping",
+            "arg": [],
+            "minions": self.minions,
+            "missing": [],
+            "_stamp": self._stamp(),
+        }
+        for minion in self.minions:
+            yield "salt/job/%s/ret/%s" % (jid, minion), {
+                "cmd": "_return",
+                "id": minion,
+                "success": True,
+                "return": True,
+                "retcode": 0,
+                "jid": jid,
+                "fun": "test.ping",
+                "fun_args": [],
+                "_stamp": self._stamp(),
+            }
+
+    def batch(self):
+        jid = self._jid()
+        down_minions = self._rand.sample(self.minions, len(self.minions) // 20)
+        for sub in ("start", "done"):
+            yield "salt/batch/%s/%s" % (jid, sub), {
+                "available_minions": self.minions,
+                "down_minions": down_minions,
+                "metadata": {},
+                "_stamp": self._stamp(),
+            }
+
+    def minion_events(self, minion):
+        yield "salt/auth", {
+            "result": True,
+            "act": "accept",
+            "id": minion,
+            "pub": "-----BEGIN PUBLIC KEY-----",
+            "_stamp": self._stamp(),
+        }
+        yield "salt/minion/%s/start" % minion, {
+            "data": "Minion %s started" % minion,
+            "cmd": "_minion_event",
+            "id": minion,
+            "_stamp": self._stamp(),
+        }
+        yield "minion/refresh/%s" % minion, {
+            "Minion data cache refresh": minion,
+            "_stamp": self._stamp(),
+        }
+
+    def stats(self):
+        yield "salt/stats/master", {
+            "time": 60,
+            "worker": "master",
+            "stats": {
+                cmd: {
+                    "runs": self._rand.randint(1, 1000),
+                    "mean": self._rand.uniform(0.001, 0.5),
+                }
+                for cmd in ("_auth", "_return", "_pillar", "_file_find")
+            },
+            "_stamp": self._stamp(),
+        }
+
+    def events(self):
+        """
+        Generate the mix of the events of all the kinds
+        """
+
+        for minion in self.minions:
+            yield from self.minion_events(minion)
+        for i in range(self.jobs):
+            yield from self.highstate()
+            yield from self.ping()
+            if i % 3 == 0:
+                yield from self.batch()
+            yield from self.stats()
@@ -0,0 +1,326 @@
+"""
+End-to-end throughput test of the Saline processes reading the events
+from the stand-in Salt Event Bus publisher
+
+    python -m benchmarks.pipeline --rate 2000 --duration 30 --min-rate 1900 --max-lag 5
+
+The events are generated or replayed from the capture file with ``--capture``,
+the exit code is 1 if the sustained rate or the lag are out of the bounds.
+"""
+
+import argparse
+import copy
+import itertools
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+import salt._logging
+import salt.config
+import salt.transport.ipc
+import salt.utils.asynchronous
+
+from multiprocessing import Queue
+from threading import Thread
+from time import monotonic, sleep
+
+from salt.ext.tornado.ioloop import IOLoop
+
+from benchmarks.generator import EventsGenerator
+from benchmarks.publisher import FakeMasterPublisher
+from benchmarks.runner import get_opts
+from saline.capture import read_capture
+from saline.data.event import EventParser
+from saline.process import DataManager, EventsManager, EventsReader
+
+
+def parse_metrics(buf):
+    """
+    Sum the values of the metrics in Prometheus text format by the metric names
+    """
+
+    values = {}
+    for line in buf.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name, _, value = line.rpartition(" ")
+        name = name.partition("{")[0]
+        try:
+            values[name] = values.get(name, 0) + float(value)
+        except ValueError:
+            pass
+    return values
+
+
+class MetricsSubscriber:
+    """
+    Subscriber to the metrics published by the Saline Data Manager
+    """
+
+    def __init__(self, sock_dir):
+        self.pub_uri = os.path.join(sock_dir, "publisher.ipc")
+        self.io_loop = None
+        self.subscriber = None
+        self.snapshots = []
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        self.io_loop = IOLoop()
+        with salt.utils.asynchronous.current_ioloop(self.io_loop):
+            self.subscriber = salt.transport.ipc.IPCMessageSubscriber(
+                self.pub_uri, io_loop=self.io_loop
+            )
+            self.io_loop.run_sync(lambda: self.subscriber.read_async(self._handle))
+
+    def _handle(self, raw):
+        if "metrics" in raw:
+            self.snapshots.append((monotonic(), parse_metrics(raw["metrics"])))
+
+    def last(self, name, default=0):
+        if not self.snapshots:
+            return default
+        return self.snapshots[-1][1].get(name, default)
+
+    def max(self, name, default=0):
+        return max((s.get(name, default) for _, s in self.snapshots), default=default)
+
+
+class PipelineResult:
+    """
+    The outcome of one end-to-end run
+    """
+
+    def __init__(self, published, expected, processed, published_in, drained_in, lag):
+        self.published = published
+        self.expected = expected
+        self.processed = processed
+        self.published_in = published_in
+        self.drained_in = drained_in
+        self.lag = lag
+
+    @property
+    def rate(self):
+        return self.processed / self.drained_in if self.drained_in else 0.0
+
+    def __str__(self):
+        return (
+            "published %d events in %.1f s (%.1f events/s), "
+            "processed %d of %d in %.1f s (%.1f events/s), max lag %.3f s"
+            % (
+                self.published,
+                self.published_in,
+                self.published / self.published_in if self.published_in else 0.0,
+                self.processed,
+                self.expected,
+                self.drained_in,
+                self.rate,
+                self.lag,
+            )
+        )
+
+
+def _get_processed_flags(events, opts):
+    # Not all of the events are counted as processed by Saline,
+    # like the ones filtered out or ignored by the parser
+    parser = EventParser(opts)
+    return [
+        parser.parse(tag, copy.deepcopy(data)) is not None
+        if isinstance(data, dict)
+        else True
+        for tag, data in events
+    ]
+
+
+def run_pipeline(events, opts, rate=0, duration=None, drain_timeout=60):
+    """
+    Run the Saline processes against the stand-in publisher
+    and publish the events to them
+
+    :param list events: The (tag, data) events to publish, cycled within the duration
+    :param dict opts: The Saline options, ``sock_dir`` and ``events_source_*``
+        options are overridden with the temporary ones
+    :param float rate: The target events per second, 0 for as fast as possible
+    :param float duration: The seconds to publish the events for,
+        the events are published once if not set
+    :param float drain_timeout: The seconds to wait for the processing to finish
+    """
+
+    tmp_dir = tempfile.mkdtemp(prefix="saline-pipeline-")
+    master_sock_dir = os.path.join(tmp_dir, "master")
+    os.mkdir(master_sock_dir)
+    # The minimal master config for the events source to read
+    # instead of the one of the Salt Master running on the host
+    master_config = os.path.join(tmp_dir, "master.conf")
+    with open(master_config, "w") as fh:
+        fh.write("sock_dir: {}\ntransport: zeromq\n".format(master_sock_dir))
+    opts = dict(
+        opts,
+        sock_dir=tmp_dir,
+        events_source="salt",
+        events_source_sock_dir=master_sock_dir,
+        events_source_master_config=master_config,
+    )
+    processed_flags = _get_processed_flags(events, opts)
+
+    # The Saline processes set up the logging from these options on start
+    salt._logging.set_logging_options_dict(
+        dict(
+            salt.config.DEFAULT_MASTER_OPTS,
+            log_level="error",
+            log_file=os.path.join(tmp_dir, "saline.log"),
+        )
+    )
+
+    publisher = FakeMasterPublisher(master_sock_dir)
+    publisher.start()
+
+    readers_count = int(opts["readers_subprocesses"])
+    queues = [Queue()]
+    if opts.get("events_sharding", False):
+        queues.extend(Queue() for _ in range(readers_count - 1))
+    ret_queue = Queue()
+    processes = [
+        EventsManager(opts, queues, ret_queue),
+        DataManager(opts, ret_queue),
+        *(
+            EventsReader(opts, queues[i % len(queues)], ret_queue, i)
+            for i in range(readers_count)
+        ),
+    ]
+    try:
+        for process in processes:
+            process.start()
+
+        metrics = MetricsSubscriber(tmp_dir)
+        metrics.start()
+        if not publisher.wait_subscribers():
+            raise RuntimeError("The Events Manager has not subscribed to the events")
+
+        started = monotonic()
+        published, published_in = publisher.run(
+            events if duration is None else itertools.cycle(events),
+            rate=rate,
+            duration=duration,
+        )
+        expected = sum(
+            processed_flags[i % len(events)] for i in range(published)
+        )
+
+        # The metrics are published by the Data Manager not more often
+        # than every 3 seconds, so the drain time is rounded up to it
+        deadline = monotonic() + drain_timeout
+        while (
+            metrics.last("salt_events_total") < expected and monotonic() < deadline
+        ):
+            sleep(0.1)
+        drained_in = (
+            metrics.snapshots[-1][0] - started if metrics.snapshots else 0.0
+        )
+        return PipelineResult(
+            published,
+            expected,
+            int(metrics.last("salt_events_total")),
+            published_in,
+            drained_in,
+            metrics.max("saline_internal_events_lag_seconds"),
+        )
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(10)
+            if process.is_alive():
+                process.kill()
+        publisher.stop()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.pipeline",
+        description="Run the end-to-end throughput test of the Saline processes",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="The random seed")
+    parser.add_argument(
+        "--minions", type=int, default=100, help="The number of minions"
+    )
+    parser.add_argument(
+        "--states", type=int, default=50, help="The number of states per highstate"
+    )
+    parser.add_argument("--jobs", type=int, default=5, help="The number of jobs")
+    parser.add_argument(
+        "--capture", help="Publish the events from the capture file instead"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="The target events per second, 0 for as fast as possible",
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        help="The seconds to publish the events for, once if not set",
+    )
+    parser.add_argument(
+        "--readers", type=int, default=3, help="The number of events readers"
+    )
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=60,
+        help="The seconds to wait for the events to be processed",
+    )
+    parser.add_argument(
+        "--min-rate", type=float, help="Fail if the sustained events/s is lower"
+    )
+    parser.add_argument(
+        "--max-lag", type=float, help="Fail if the events lag in seconds is higher"
+    )
+    args = parser.parse_args()
+
+    logging.getLogger("saline").setLevel(logging.ERROR)
+
+    if args.capture:
+        events = [(tag, data) for _, tag, data in read_capture(args.capture)]
+    else:
+        events = list(
+            EventsGenerator(
+                seed=args.seed,
+                minions=args.minions,
+                states=args.states,
+                jobs=args.jobs,
+            ).events()
+        )
+    opts = get_opts(readers_subprocesses=args.readers)
+
+    result = run_pipeline(
+        events,
+        opts,
+        rate=args.rate,
+        duration=args.duration,
+        drain_timeout=args.drain_timeout,
+    )
+    print(result)
+
+    failed = False
+    if result.processed < result.expected:
+        print("FAIL: %d events are not processed" % (result.expected - result.processed))
+        failed = True
+    if args.min_rate is not None and result.rate < args.min_rate:
+        print("FAIL: %.1f events/s is lower than %.1f" % (result.rate, args.min_rate))
+        failed = True
+    if args.max_lag is not None and result.lag > args.max_lag:
+        print("FAIL: %.3f s lag is higher than %.3f" % (result.lag, args.max_lag))
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
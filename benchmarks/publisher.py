@@ -0,0 +1,129 @@
+import os
+
+import salt.payload
+import salt.transport.ipc
+import salt.utils.asynchronous
+import salt.utils.files
+import salt.utils.stringutils
+
+from datetime import datetime, timezone
+from threading import Event, Thread
+from time import monotonic, sleep
+
+from salt.ext.tornado.ioloop import IOLoop
+from salt.utils.event import TAGEND
+
+
+class FakeMasterPublisher:
+    """
+    Stand-in for the publisher of the Salt Event Bus of the Salt Master
+
+    Serves ``master_event_pub.ipc`` in the socket directory with the same
+    IPC pub protocol and the same event framing as the Salt Master does,
+    so the Saline Events Manager could read the events from it with
+    ``events_source_sock_dir`` pointing to the socket directory.
+    """
+
+    def __init__(self, sock_dir):
+        """
+        Create the publisher
+
+        :param str sock_dir: The socket directory to create the socket in
+        """
+
+        self.sock_dir = sock_dir
+        self.pub_uri = os.path.join(sock_dir, "master_event_pub.ipc")
+        self.io_loop = None
+        self.publisher = None
+        self.published = 0
+
+        self._tagend = salt.utils.stringutils.to_bytes(TAGEND)
+        self._started = Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def _run(self):
+        self.io_loop = IOLoop()
+        with salt.utils.asynchronous.current_ioloop(self.io_loop):
+            self.publisher = salt.transport.ipc.IPCMessagePublisher(
+                {"ipc_write_buffer": 0}, self.pub_uri, io_loop=self.io_loop
+            )
+            with salt.utils.files.set_umask(0o177):
+                self.publisher.start()
+            self.io_loop.add_callback(self._started.set)
+            self.io_loop.start()
+            self.publisher.close()
+            self.io_loop.close()
+
+    def wait_subscribers(self, count=1, timeout=30):
+        """
+        Wait for the subscribers to connect as the events published
+        before are lost the same way as on the Salt Event Bus
+        """
+
+        deadline = monotonic() + timeout
+        while len(self.publisher.streams) < count:
+            if monotonic() > deadline:
+                return False
+            sleep(0.1)
+        return True
+
+    def pack(self, tag, data):
+        """
+        Pack the event the same way as ``SaltEvent.fire_event`` does
+        stamping it with the current time, the raw payloads
+        of the captured events are passed as is
+        """
+
+        if not isinstance(data, bytes):
+            data = salt.payload.dumps(
+                dict(
+                    data,
+                    _stamp=datetime.now(timezone.utc)
+                    .replace(tzinfo=None)
+                    .isoformat(),
+                )
+            )
+        return salt.utils.stringutils.to_bytes(tag) + self._tagend + data
+
+    def publish_raw(self, raw):
+        self.io_loop.add_callback(self.publisher.publish, raw)
+        self.published += 1
+
+    def publish(self, tag, data):
+        self.publish_raw(self.pack(tag, data))
+
+    def run(self, events, rate=0, duration=None):
+        """
+        Publish the events at the target rate
+
+        :param iterable events: The (tag, data) events to publish
+        :param float rate: The target events per second, 0 for as fast as possible
+        :param float duration: Stop publishing after the number of seconds
+
+        :return: The number of the published events and the seconds it took
+        """
+
+        count = 0
+        started = monotonic()
+        for tag, data in events:
+            now = monotonic()
+            if duration is not None and now - started >= duration:
+                break
+            if rate > 0:
+                delay = started + count / rate - now
+                if delay > 0:
+                    sleep(delay)
+            self.publish(tag, data)
+            count += 1
+        return count, monotonic() - started
+
+    def stop(self):
+        if self.io_loop is not None:
+            self.io_loop.add_callback(self.io_loop.stop)
+            self._thread.join()
+            self.io_loop = None
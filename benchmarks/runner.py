@@ -0,0 +1,189 @@
+import copy
+import gc
+import tracemalloc
+
+from time import monotonic, perf_counter
+
+from saline.config import DEFAULT_SALINE_OPTS
+from saline.data.event import EventParser
+from saline.data.merger import DataMerger
+from saline.data.smart import SmartMerger
+
+
+class BenchmarkResult:
+    """
+    The timings of the calls of one benchmark
+    """
+
+    def __init__(self, name, latencies, peak_memory=None):
+        self.name = name
+        self.latencies = sorted(latencies)
+        self.total = sum(latencies)
+        self.peak_memory = peak_memory
+
+    def percentile(self, pct):
+        if not self.latencies:
+            return 0.0
+        idx = min(int(len(self.latencies) * pct / 100), len(self.latencies) - 1)
+        return self.latencies[idx]
+
+    @property
+    def rate(self):
+        return len(self.latencies) / self.total if self.total else 0.0
+
+    def __str__(self):
+        return "%-10s %10d %12.1f %10.1f %10.1f %10.1f %10s" % (
+            self.name,
+            len(self.latencies),
+            self.rate,
+            self.percentile(50) * 1e6,
+            self.percentile(90) * 1e6,
+            self.percentile(99) * 1e6,
+            "-"
+            if self.peak_memory is None
+            else "%.1f" % (self.peak_memory / 1048576),
+        )
+
+
+HEADER = "%-10s %10s %12s %10s %10s %10s %10s" % (
+    "benchmark",
+    "calls",
+    "calls/s",
+    "p50 us",
+    "p90 us",
+    "p99 us",
+    "peak MiB",
+)
+
+
+def get_opts(**kwargs):
+    opts = dict(DEFAULT_SALINE_OPTS)
+    opts.update(kwargs)
+    return opts
+
+
+def measure(name, func, items, trace_memory=True):
+    """
+    Measure the time of calling the function for each of the items
+
+    :param str name: The name of the benchmark
+    :param callable func: The function to call with the item
+    :param callable items: The function returning the fresh list of the items
+        as the called function could modify them
+    :param bool trace_memory: Make one more pass with tracing the peak memory
+    """
+
+    latencies = []
+    batch = items()
+    gc.collect()
+    for item in batch:
+        started = perf_counter()
+        func(item)
+        latencies.append(perf_counter() - started)
+    peak_memory = None
+    if trace_memory:
+        batch = items()
+        gc.collect()
+        tracemalloc.start()
+        for item in batch:
+            func(item)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return BenchmarkResult(name, latencies, peak_memory)
+
+
+def bench_parser(events, opts, trace_memory=True):
+    parser = EventParser(opts)
+    return measure(
+        "parser",
+        lambda event: parser.parse(*event),
+        lambda: copy.deepcopy(events),
+        trace_memory=trace_memory,
+    )
+
+
+def _parse(events, opts):
+    parser = EventParser(opts)
+    parsed = []
+    for tag, data in copy.deepcopy(events):
+        parsed_data = parser.parse(tag, data)
+        if parsed_data is not None:
+            parsed_data["rix"] = 0
+            parsed.append(parsed_data)
+    return parsed
+
+
+def bench_merger(events, opts, trace_memory=True, batch_size=50):
+    # The events are passed in batches with the pipeline stamps
+    # as the Data Manager does, so each call is the merge of one batch
+    parsed = _parse(events, opts)
+    datamergers = []
+
+    def items():
+        datamergers.append(DataMerger(opts))
+        batch = copy.deepcopy(parsed)
+        now = monotonic()
+        for data in batch:
+            data["stamps"] = [now, now, now]
+        return [
+            batch[idx : idx + batch_size] for idx in range(0, len(batch), batch_size)
+        ]
+
+    return measure(
+        "merger",
+        lambda batch: datamergers[-1].add_many(batch),
+        items,
+        trace_memory=trace_memory,
+    )
+
+
+def bench_metrics(events, opts, trace_memory=True, calls=20):
+    datamerger = DataMerger(opts)
+    for data in _parse(events, opts):
+        datamerger.add(data)
+    datamerger.merge_pending()
+    datamerger.jobs_metrics_update()
+    return measure(
+        "metrics",
+        lambda _: datamerger.get_metrics(),
+        lambda: range(calls),
+        trace_memory=trace_memory,
+    )
+
+
+def bench_smart(events, opts, trace_memory=True, values=200):
+    # The state IDs containing the minion ID, like the ones generated
+    # for each minion with Jinja, is the case the smart merger is for
+    sids = []
+    for _, data in events:
+        ret = data.get("return")
+        if isinstance(ret, dict):
+            sids.extend(
+                "%s_%s" % (r["__id__"], data["id"])
+                for r in ret.values()
+                if isinstance(r, dict)
+            )
+    sids = list(dict.fromkeys(sids))[:values]
+    start_merging_on = (
+        opts.get("merge_rules", {}).get("sid", {}).get("start_merging_on", 150)
+    )
+    smart_mergers = []
+
+    def items():
+        smart_mergers.append(SmartMerger(start_merging_on, data={}))
+        return sids
+
+    return measure(
+        "smart",
+        lambda sid: smart_mergers[-1].add(sid),
+        items,
+        trace_memory=trace_memory,
+    )
+
+
+BENCHMARKS = {
+    "parser": bench_parser,
+    "merger": bench_merger,
+    "metrics": bench_metrics,
+    "smart": bench_smart,
+}
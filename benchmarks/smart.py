@@ -0,0 +1,106 @@
+"""
+Scaling benchmark of the merging rules discovery of the smart merger
+
+    python -m benchmarks.smart --sizes 100 200 400 800
+
+Each size is the number of the values the rules are discovered for,
+the time growing 4 times on doubling the size means quadratic scaling.
+"""
+
+import argparse
+import random
+
+from time import perf_counter
+
+from saline.data.smart import SmartMerger
+
+
+VALUE_FORMATS = (
+    "packages.packages_{0}",
+    "services/web_{0}.conf",
+    "util.sync_{0}",
+    "pkg_{0}_minion{1:05d}.example.org",
+    "users.user_{2}",
+    "cron.job_{0}_{1}",
+)
+
+
+def get_values(count, seed=0):
+    """
+    Generate the values similar to the generated sls names and state IDs
+    """
+
+    rand = random.Random(seed)
+    values = {}
+    while len(values) < count:
+        value = rand.choice(VALUE_FORMATS).format(
+            rand.randint(0, 99999),
+            rand.randint(0, 99999),
+            "".join(rand.choice("abcdefghij") for _ in range(6)),
+        )
+        values[value] = None
+    return list(values)
+
+
+def bench_rules(values, start_merging_on, match_quality=0.7):
+    """
+    Measure the time of discovering the merging rules for the values
+
+    :return: The seconds it took and the discovered rules
+    """
+
+    smart_merger = SmartMerger(
+        start_merging_on,
+        match_quality=match_quality,
+        data=dict.fromkeys(values),
+    )
+    started = perf_counter()
+    rules = smart_merger.get_new_rules()
+    return perf_counter() - started, rules or []
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.smart",
+        description="Run the scaling benchmark of the smart merger rules discovery",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="The random seed")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[100, 200, 400, 800],
+        help="The numbers of the values to discover the rules for",
+    )
+    parser.add_argument(
+        "--match-quality",
+        type=float,
+        default=0.7,
+        help="The match quality used by the data merger",
+    )
+    args = parser.parse_args()
+
+    print("%10s %10s %10s %8s" % ("values", "seconds", "growth", "rules"))
+    prev = None
+    for size in args.sizes:
+        values = get_values(size, seed=args.seed)
+        # Start merging just below the number of the values
+        # as it happens on adding the values one by one
+        seconds, rules = bench_rules(
+            values, max(size - 1, 1), match_quality=args.match_quality
+        )
+        print(
+            "%10d %10.3f %10s %8d"
+            % (
+                size,
+                seconds,
+                "-" if prev is None else "%.1fx" % (seconds / prev),
+                len(rules),
+            ),
+            flush=True,
+        )
+        prev = seconds
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+import logging
+import pickle
+import re
+import struct
+import tempfile
+
+from collections import deque
+from queue import Empty as QueueEmpty
+from threading import Condition
+from time import monotonic
+from zlib import crc32
+
+from saline.data.cache import LRUCache
+
+
+log = logging.getLogger(__name__)
+
+
+_NO_CLASS = -1
+
+
+class EventsBuffer:
+    """
+    Bounded FIFO buffer handing over the events from the IO loop
+    to the events filtering thread
+    """
+
+    POLICY_DROP = "drop"
+    POLICY_SPILL = "spill"
+
+    _RECORD_HEAD = struct.Struct(">I")
+
+    def __init__(
+        self,
+        high_water_mark=100000,
+        policy=POLICY_DROP,
+        spill_dir=None,
+        spill_limit=1073741824,
+    ):
+        """
+        Create the events buffer
+
+        :param int high_water_mark: The maximum number of events kept in memory
+        :param str policy: What to do with the events above the high water mark:
+            ``drop`` them or ``spill`` them to the temporary file
+        :param str spill_dir: The directory to create the spill file in
+        :param int spill_limit: The maximum size of the spill file in bytes,
+            the events are dropped once the limit is reached
+        """
+
+        if policy not in (self.POLICY_DROP, self.POLICY_SPILL):
+            log.warning(
+                "Unknown events buffer policy '%s', falling back to '%s'",
+                policy,
+                self.POLICY_DROP,
+            )
+            policy = self.POLICY_DROP
+
+        self._items = deque()
+        self._cond = Condition()
+        self._high_water_mark = max(int(high_water_mark), 1)
+        self._policy = policy
+        self._spill_dir = spill_dir
+        self._spill_limit = spill_limit
+        self._spill = None
+        self._spill_read_pos = 0
+        self._spill_write_pos = 0
+        self._spill_count = 0
+
+        self.dropped = 0
+        self.spilled = 0
+
+    def __len__(self):
+        return len(self._items) + self._spill_count
+
+    def put(self, item):
+        """
+        Put the item to the buffer, returns False if the item was dropped
+        """
+
+        with self._cond:
+            if self._spill_count or len(self._items) >= self._high_water_mark:
+                if self._policy != self.POLICY_SPILL or not self._spill_item(item):
+                    self.dropped += 1
+                    return False
+            else:
+                self._items.append(item)
+            self._cond.notify()
+        return True
+
+    def get(self, timeout=None):
+        """
+        Get the item from the buffer waiting for it if the buffer is empty
+
+        :raises queue.Empty: if no item is available within the timeout
+        """
+
+        with self._cond:
+            if not self._cond.wait_for(self.__len__, timeout):
+                raise QueueEmpty
+            if not self._items:
+                self._unspill()
+            return self._items.popleft()
+
+    def depth(self):
+        """
+        Get the number of items kept in memory and spilled to the file
+        """
+
+        return len(self._items), self._spill_count
+
+    def _spill_item(self, item):
+        try:
+            payload = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as exc:  # pylint: disable=broad-except
+            log.debug("Unable to spill the event: %s", exc)
+            return False
+        record_size = self._RECORD_HEAD.size + len(payload)
+        if self._spill_write_pos + record_size > self._spill_limit:
+            return False
+        try:
+            if self._spill is None:
+                self._spill = tempfile.TemporaryFile(
+                    prefix="saline-spill-", dir=self._spill_dir
+                )
+            self._spill.seek(self._spill_write_pos)
+            self._spill.write(self._RECORD_HEAD.pack(len(payload)))
+            self._spill.write(payload)
+        except OSError as exc:
+            log.error("Unable to write the events spill file: %s", exc)
+            return False
+        self._spill_write_pos += record_size
+        self._spill_count += 1
+        self.spilled += 1
+        return True
+
+    def _unspill(self):
+        self._spill.flush()
+        self._spill.seek(self._spill_read_pos)
+        while self._spill_count and len(self._items) < self._high_water_mark:
+            (size,) = self._RECORD_HEAD.unpack(
+                self._spill.read(self._RECORD_HEAD.size)
+            )
+            self._items.append(pickle.loads(self._spill.read(size)))
+            self._spill_count -= 1
+        self._spill_read_pos = self._spill.tell()
+        if self._spill_count == 0:
+            # Reuse the spill file from the beginning once it was read completely
+            self._spill.seek(0)
+            self._spill.truncate()
+            self._spill_read_pos = 0
+            self._spill_write_pos = 0
+
+
+class QueueBatcher:
+    """
+    Micro-batching producer putting the lists of items to the queue
+    """
+
+    def __init__(self, queue, batch_size=1, batch_timeout=50):
+        """
+        Create the queue batcher
+
+        :param Queue queue: The queue to put the batches to
+        :param int batch_size: The number of items to flush the batch on,
+            the items are put to the queue one by one if it's lower than 2
+        :param int batch_timeout: The maximum time in milliseconds
+            the item could wait in the batch before flushing
+        """
+
+        self._queue = queue
+        self._batch_size = batch_size
+        self._batch_timeout = batch_timeout / 1000
+        self._batch = []
+        self._flush_at = None
+
+    def _put(self, data):
+        try:
+            self._queue.put(data)
+        except ValueError as exc:
+            # The data doesn't fit the shared memory queue or the queue is closed
+            log.error("Unable to pass the data to the queue: %s", exc)
+
+    def put(self, item):
+        if self._batch_size < 2:
+            self._put(item)
+            return
+        if not self._batch:
+            self._flush_at = monotonic() + self._batch_timeout
+        self._batch.append(item)
+        if len(self._batch) >= self._batch_size or monotonic() >= self._flush_at:
+            self.flush()
+
+    def flush(self):
+        if self._batch:
+            self._put(self._batch)
+            self._batch = []
+            self._flush_at = None
+
+    def flush_due(self):
+        """
+        Flush the pending batch if it's waiting for longer than the batch timeout
+        """
+
+        if self._batch and monotonic() >= self._flush_at:
+            self.flush()
+
+    def timeout(self, default=None):
+        """
+        Get the time left before the pending batch has to be flushed
+        """
+
+        if not self._batch:
+            return default
+        return max(self._flush_at - monotonic(), 0)
+
+
+def unbatch(data):
+    """
+    Get the items from the data received from the queue fed by QueueBatcher
+    """
+
+    return data if isinstance(data, list) else (data,)
+
+
+class ShardedBatcher:
+    """
+    Micro-batching producer distributing the items across the queues by the key
+    """
+
+    def __init__(self, queues, batch_size=1, batch_timeout=50):
+        """
+        Create the sharded batcher
+
+        :param list queues: The queues to distribute the items to
+        :param int batch_size: The number of items to flush the batch on
+        :param int batch_timeout: The maximum time in milliseconds
+            the item could wait in the batch before flushing
+        """
+
+        self._batchers = [
+            QueueBatcher(queue, batch_size=batch_size, batch_timeout=batch_timeout)
+            for queue in queues
+        ]
+
+    def put(self, key, item):
+        """
+        Put the item to the queue selected with the key,
+        the items with the same key are always going to the same queue
+        """
+
+        if len(self._batchers) == 1:
+            self._batchers[0].put(item)
+            return
+        shard = crc32(key.encode("utf-8", "surrogateescape")) % len(self._batchers)
+        self._batchers[shard].put(item)
+
+    def flush_due(self):
+        for batcher in self._batchers:
+            batcher.flush_due()
+
+    def timeout(self, default=None):
+        timeouts = [
+            timeout
+            for timeout in (batcher.timeout() for batcher in self._batchers)
+            if timeout is not None
+        ]
+        return min(timeouts) if timeouts else default
+
+
+class LoadShedder:
+    """
+    Sample or drop the events of the low priority tag classes
+    depending on the number of the events waiting to be processed
+    """
+
+    ACTION_SAMPLED = "sampled"
+    ACTION_DROPPED = "dropped"
+
+    def __init__(self, classes, cache_size=4096):
+        """
+        Create the load shedder
+
+        :param list classes: The tag classes to shed the events of, each one is
+            the dict with ``name``, ``regex`` to match the tag with,
+            ``sample_above`` and ``drop_above`` queue depths,
+            and ``sample_rate`` to pass 1 of the N events on sampling.
+            The first matching class is used, the events not matching
+            any class have the highest priority and are never shed.
+        :param int cache_size: The size of LRU cache for the tag classes
+        """
+
+        self._classes = []
+        for cls in classes:
+            try:
+                regex = re.compile(cls["regex"])
+            except (KeyError, re.error) as exc:
+                log.error("Unable to use the shedding class %s: %s", cls, exc)
+                continue
+            self._classes.append(
+                (
+                    cls.get("name", cls["regex"]),
+                    regex,
+                    cls.get("sample_above"),
+                    max(int(cls.get("sample_rate", 10)), 1),
+                    cls.get("drop_above"),
+                )
+            )
+        self._cache = LRUCache(cache_size)
+        self._seen = [0] * len(self._classes)
+        self.shed = {}
+
+    def __bool__(self):
+        return bool(self._classes)
+
+    def _classify(self, tag):
+        idx = self._cache.get(tag)
+        if idx is None:
+            idx = _NO_CLASS
+            for i, cls in enumerate(self._classes):
+                if cls[1].match(tag):
+                    idx = i
+                    break
+            self._cache.set(tag, idx)
+        return idx
+
+    def weight(self, tag, depth):
+        """
+        Get the weight to scale the counters of the event by,
+        returns 0 if the event has to be shed
+
+        :param str tag: The tag of the event
+        :param int depth: The number of the events waiting to be processed
+        """
+
+        idx = self._classify(tag)
+        if idx == _NO_CLASS:
+            return 1
+        name, _, sample_above, sample_rate, drop_above = self._classes[idx]
+        if drop_above is not None and depth > drop_above:
+            self._count(name, self.ACTION_DROPPED)
+            return 0
+        if sample_above is not None and depth > sample_above and sample_rate > 1:
+            self._seen[idx] += 1
+            if self._seen[idx] % sample_rate:
+                self._count(name, self.ACTION_SAMPLED)
+                return 0
+            return sample_rate
+        return 1
+
+    def _count(self, name, action):
+        key = (name, action)
+        self.shed[key] = self.shed.get(key, 0) + 1
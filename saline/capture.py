@@ -0,0 +1,133 @@
+import logging
+import msgpack
+import struct
+
+from time import monotonic, time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+log = logging.getLogger(__name__)
+
+
+_RECORD_HEAD = struct.Struct(">I")
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class EventsCaptureWriter:
+    """
+    Append-only writer of the events to the capture file
+    of length-prefixed msgpack records, optionally compressed with zstd
+    """
+
+    # The maximum time in seconds the written events could stay in the buffers
+    FLUSH_INTERVAL = 1
+
+    def __init__(self, path, compress=False):
+        """
+        Open the capture file to append the events to
+
+        :param str path: The path to the capture file
+        :param bool compress: Compress the records with zstd,
+            the capture file is not compressed if zstandard is not available
+        """
+
+        self.path = path
+        self._file = open(path, "ab")
+        self._writer = self._file
+        if compress:
+            if zstandard is None:
+                log.warning(
+                    "Unable to compress the events capture file: "
+                    "zstandard is not available"
+                )
+            elif self._file.tell() and not _is_compressed(path):
+                log.warning(
+                    "Unable to compress the events appended to "
+                    "the not compressed capture file: %s",
+                    path,
+                )
+            else:
+                self._writer = zstandard.ZstdCompressor().stream_writer(self._file)
+        self._flushed = monotonic()
+        self.count = 0
+
+    def write(self, tag, data, ts=None):
+        """
+        Write the event to the capture file
+
+        :param str tag: The tag of the event
+        :param data: The data of the event or the raw msgpack payload
+        :param float ts: The time the event was received at
+        """
+
+        payload = msgpack.packb(
+            [time() if ts is None else ts, tag, data], use_bin_type=True
+        )
+        self._writer.write(_RECORD_HEAD.pack(len(payload)))
+        self._writer.write(payload)
+        self.count += 1
+        if monotonic() - self._flushed >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self._writer is not self._file:
+            self._writer.flush(zstandard.FLUSH_BLOCK)
+        self._file.flush()
+        self._flushed = monotonic()
+
+    def close(self):
+        if self._writer is not self._file:
+            # Finish the zstd frame, the next writer appends a new one
+            self._writer.flush(zstandard.FLUSH_FRAME)
+        self._file.close()
+
+
+def _is_compressed(path):
+    with open(path, "rb") as fh:
+        return fh.read(len(_ZSTD_MAGIC)) == _ZSTD_MAGIC
+
+
+def _read(fh, size):
+    data = fh.read(size)
+    # The decompressing reader could return less than requested on the frame end
+    while len(data) < size:
+        chunk = fh.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def read_capture(path):
+    """
+    Generator returning the (ts, tag, data) records from the capture file
+    """
+
+    with open(path, "rb") as fh:
+        if fh.read(len(_ZSTD_MAGIC)) == _ZSTD_MAGIC:
+            if zstandard is None:
+                raise RuntimeError(
+                    "Unable to read the compressed events capture file: "
+                    "zstandard is not available"
+                )
+            fh.seek(0)
+            fh = zstandard.ZstdDecompressor().stream_reader(
+                fh, read_across_frames=True
+            )
+        else:
+            fh.seek(0)
+        while True:
+            head = _read(fh, _RECORD_HEAD.size)
+            if len(head) < _RECORD_HEAD.size:
+                return
+            (size,) = _RECORD_HEAD.unpack(head)
+            payload = _read(fh, size)
+            if len(payload) < size:
+                log.warning("The last record of the capture file is incomplete")
+                return
+            ts, tag, data = msgpack.unpackb(payload, raw=False)
+            yield ts, tag, data
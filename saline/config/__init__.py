@@ -60,16 +60,105 @@ VALID_OPTS = immutabletypes.freeze(
         "user": str,
         # The number of event readers subprocesses
         "readers_subprocesses": int,
+        # Add or retire the event readers depending on the request queue backlog
+        "readers_autoscale": bool,
+        # The minimal and maximal number of event readers on autoscaling
+        "readers_min": int,
+        "readers_max": int,
+        # The interval of checking the request queue backlog for autoscaling
+        "readers_autoscale_interval": int,
+        # The backlog in events per reader to add one more event reader on
+        "readers_scale_up_backlog": int,
+        # The backlog in events to retire the event reader on
+        "readers_scale_down_backlog": int,
+        # The number of seconds the backlog stays low to retire the event reader
+        "readers_scale_down_after": int,
+        # Count the events in the event readers and pass the counters as deltas
+        "readers_aggregation": bool,
+        # The interval in milliseconds of passing the counters from the readers
+        "readers_aggregation_interval": int,
+        # The maximum number of the events to merge with one metrics update
+        "datamerger_batch_size": int,
         # The events regex filter limiting the scope of events to watch
         "events_regex_filter": str,
         # The list of additional allowed events
         "events_additional": list,
+        # The size of LRU cache of the recent events filter decisions
+        "events_filter_cache_size": int,
+        # The maximum number of events kept in the events manager buffer
+        "events_buffer_high_water_mark": int,
+        # What to do with the events above the high water mark: drop or spill
+        "events_buffer_policy": str,
+        # The directory to spill the events to on the events manager buffer overflow
+        "events_buffer_spill_dir": (type(None), str),
+        # The maximum size of the events spill file in bytes
+        "events_buffer_spill_limit": int,
+        # Pass the raw event payloads to the events readers to decode them there
+        "events_raw_forwarding": bool,
+        # Sample or drop the events of the low priority tag classes on overload
+        "events_shedding": bool,
+        # The tag classes to shed with the queue depths to start sampling
+        # and dropping the events at, the other events are never shed.
+        # The depth is the number of the events in the internal queue
+        # of the Events Manager, in the queues to the readers and
+        # in the queue to the Data Manager, the batches are counted as full
+        "events_shedding_classes": list,
+        # Pass the events of the same jid or minion to the same events reader
+        "events_sharding": bool,
+        # The source of the events: salt, replay or package.module:ClassName
+        "events_source": str,
+        # The path to the Salt Master config to read the Salt Event Bus settings from
+        "events_source_master_config": (type(None), str),
+        # Override the sock_dir of the Salt Event Bus from the Salt Master config
+        "events_source_sock_dir": (type(None), str),
+        # The file to capture the filtered events to
+        "events_capture_file": (type(None), str),
+        # Compress the captured events with zstd if zstandard is available
+        "events_capture_compress": bool,
+        # The capture file to replay the events from instead of the Salt Event Bus
+        "events_replay_file": (type(None), str),
+        # The speed of replaying the events, 0 to replay them as fast as possible
+        "events_replay_speed": (int, float),
+        # The transport to pass the events between the processes: queue or shm,
+        # shm requires Python 3.8 or newer
+        "transport": str,
+        # The size of the shared memory ring buffer in bytes for shm transport
+        "transport_shm_size": int,
+        # The number of events to pass between the processes in one batch
+        "events_batch_size": int,
+        # The maximum time in milliseconds the event could wait in the batch
+        "events_batch_timeout": int,
+        # The interval of sending the internal metrics to the data manager
+        "internal_metrics_interval": int,
         # The directory containing unix sockets
         "sock_dir": str,
         # IPC buffer size
         "ipc_write_buffer": int,
+        # Take the timestamps of the new job events from their jids
+        "jid_timestamps": bool,
+        # The jids are generated in UTC, should match utc_jid of the Salt Master
+        "utc_jid": bool,
+        # The maximum depth of the event data to look for the trimmed values
+        "trimmed_max_depth": int,
+        # The maximum number of the trimmed value pathes to report per event
+        "trimmed_max_paths": int,
+        # Pass only the values used for the metrics from the state returns
+        "compact_state_results": bool,
+        # The maximum number of the cached state templates per events reader
+        "state_templates_cache_size": int,
+        # The maximum number of the state result labels to keep mapped
+        # to the merged ones, the cache is cleared on reaching it
+        "state_labels_cache_size": int,
+        # Merge the similar sls and state IDs from the separate thread
+        # instead of merging them on adding the state results
+        "merging_background": bool,
+        # The time in milliseconds to stop starting the merges after
+        # in each pass of the merging thread running every second
+        "merging_budget": int,
         # The rules to rename SLS and state IDs to avoide huge growth of metrics
         "rename_rules": dict,
+        # The size of LRU cache of the recent SLS and state IDs rename results
+        "rename_rules_cache_size": int,
         # The interval of checking if the minion is timed out to do the job
         "job_timeout_check_interval": int,
         # The amount of seconds to consider the job is timed out for the minion
@@ -102,6 +191,16 @@ DEFAULT_SALINE_OPTS = immutabletypes.freeze(
         "verify_env": True,
         "user": salt.utils.user.get_user(),
         "readers_subprocesses": 3,
+        "readers_autoscale": False,
+        "readers_min": 1,
+        "readers_max": 10,
+        "readers_autoscale_interval": 5,
+        "readers_scale_up_backlog": 1000,
+        "readers_scale_down_backlog": 10,
+        "readers_scale_down_after": 60,
+        "readers_aggregation": False,
+        "readers_aggregation_interval": 250,
+        "datamerger_batch_size": 1000,
         "events_regex_filter": "salt/job/\d+/(new|ret/.+)",
         "events_additional": [
             "salt/auth",
@@ -113,9 +212,62 @@ DEFAULT_SALINE_OPTS = immutabletypes.freeze(
             "minion/refresh/[^\/]+",
             "suse/manager/pxe_update",
         ],
+        "events_filter_cache_size": 4096,
+        "events_buffer_high_water_mark": 100000,
+        "events_buffer_policy": "drop",
+        "events_buffer_spill_dir": None,
+        "events_buffer_spill_limit": 1073741824,
+        "events_raw_forwarding": False,
+        "events_shedding": False,
+        "events_shedding_classes": [
+            {
+                "name": "auth",
+                "regex": r"salt/auth$",
+                "sample_above": 10000,
+                "sample_rate": 10,
+                "drop_above": 50000,
+            },
+            {
+                "name": "refresh",
+                "regex": r"minion/refresh/",
+                "sample_above": 10000,
+                "sample_rate": 10,
+                "drop_above": 50000,
+            },
+            {
+                "name": "beacon",
+                "regex": r"salt/beacon/",
+                "sample_above": 5000,
+                "sample_rate": 10,
+                "drop_above": 20000,
+            },
+        ],
+        "events_sharding": False,
+        "events_source": "salt",
+        "events_source_master_config": None,
+        "events_source_sock_dir": None,
+        "events_capture_file": None,
+        "events_capture_compress": False,
+        "events_replay_file": None,
+        "events_replay_speed": 1.0,
+        "transport": "queue",
+        "transport_shm_size": 67108864,
+        "events_batch_size": 1,
+        "events_batch_timeout": 50,
+        "internal_metrics_interval": 5,
         "sock_dir": "/run/saline",
         "ipc_write_buffer": 0,
+        "jid_timestamps": False,
+        "utc_jid": False,
+        "trimmed_max_depth": 32,
+        "trimmed_max_paths": 1000,
+        "compact_state_results": True,
+        "state_templates_cache_size": 8192,
+        "state_labels_cache_size": 65536,
+        "merging_background": True,
+        "merging_budget": 200,
         "rename_rules": {"sls": {}, "sid": {}},
+        "rename_rules_cache_size": 4096,
         "job_timeout_check_interval": 120,
         "job_timeout": 1200,
         "job_metrics_update_interval": 3,
@@ -5,6 +5,7 @@ import signal
 import traceback
 
 from salt.cli.daemons import DaemonsMixin
+from salt.exceptions import SaltConfigurationError
 from salt.utils.process import HAS_PSUTIL, notify_systemd
 from salt.utils.user import get_user
 from salt.utils.verify import check_user, verify_env, verify_log
@@ -71,7 +72,11 @@ class Saline(SalineOptionParser, DaemonsMixin):
         # Late import so logging works correctly
         import saline.process
 
-        self.main_process = saline.process.Saline(self.config)
+        try:
+            self.main_process = saline.process.Saline(self.config)
+        except SaltConfigurationError as exc:
+            log.error("Unable to start the Saline: %s", exc)
+            self.shutdown(1, str(exc))
 
         self.daemonize_if_required()
         self.set_pidfile()
@@ -0,0 +1,39 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Bounded cache evicting the least recently used entries
+    """
+
+    def __init__(self, maxsize=4096):
+        """
+        Create the LRU cache
+
+        :param int maxsize: The maximum number of entries to keep in the cache
+        """
+
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self._maxsize <= 0:
+            return
+        self._data[key] = value
+        if len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
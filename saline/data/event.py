@@ -1,8 +1,8 @@
 import logging
-import re
 
 
 from saline.data.parser import (
+    get_jid_timestamp,
     get_tag_mask,
     get_timestamp,
     get_trimmed,
@@ -14,11 +14,18 @@ from saline.data.parser import (
     IGNORE_NO_FUN_WARNING,
     STATE_RESULTS,
 )
+from saline.data.rename import RenameRules
 
 
 log = logging.getLogger(__name__)
 
 
+# The state result values the state template depends on
+_STATE_TEMPLATE_KEYS = ("name", "__sls__", "__id__")
+
+_MISSING = object()
+
+
 class EventParser:
     """
     Salt Event Parser object
@@ -29,17 +36,86 @@ class EventParser:
         Create a Salt Event Parser object instance
         """
 
-        self.sls_rules = []
-        self.sid_rules = []
+        self.jid_timestamps = opts.get("jid_timestamps", False)
+        self.utc_jid = opts.get("utc_jid", False)
+
+        self.trimmed_max_depth = opts.get("trimmed_max_depth", 32)
+        self.trimmed_max_paths = opts.get("trimmed_max_paths", 1000)
+
+        self.compact_state_results = opts.get("compact_state_results", True)
 
-        for k, v in opts.get("rename_rules", {}).get("sls", {}).items():
-            self.sls_rules.append((re.compile(k), v))
-        for k, v in opts.get("rename_rules", {}).get("sid", {}).items():
-            self.sid_rules.append((re.compile(k), v))
+        self._state_templates = {}
+        self._state_templates_size = opts.get("state_templates_cache_size", 8192)
 
-    def parse(self, tag, data):
+        rename_rules = opts.get("rename_rules", {})
+        rename_cache_size = opts.get("rename_rules_cache_size", 4096)
+        self.sls_rules = RenameRules(
+            rename_rules.get("sls", {}), cache_size=rename_cache_size
+        )
+        self.sid_rules = RenameRules(
+            rename_rules.get("sid", {}), cache_size=rename_cache_size
+        )
+
+    def _make_state_template(self, rtag, state):
+        state_id, state_fun, state_name = split_state_tags(rtag, state.get("name"))
+        if state_name and "name" not in state:
+            state["name"] = state_name
+        sls = state.get("__sls__")
+        if sls:
+            _sls = sls.replace("/", ".")
+            if sls != _sls:
+                state["__sls__"] = _sls
+                state["__sls_orig__"] = sls
+            renamed = self.sls_rules.rename(_sls)
+            if renamed is not None:
+                state["__sls__"] = renamed
+                state["__sls_orig__"] = sls
+        sid = state.get("__id__", state_id)
+        if sid:
+            if "__id__" not in state:
+                state["__id__"] = sid
+            renamed = self.sid_rules.rename(sid)
+            if renamed is not None:
+                state["__id__"] = renamed
+                state["__id_orig__"] = sid
+        state["fun"] = state_fun
+        return state
+
+    def _get_state_template(self, rtag, ret):
+        """
+        Get the values to update the state result with,
+        the state results of the same state are the same in every return
+        """
+
+        key = (
+            rtag,
+            ret.get("name", _MISSING),
+            ret.get("__sls__", _MISSING),
+            ret.get("__id__", _MISSING),
+        )
+        try:
+            template = self._state_templates.get(key)
+        except TypeError:
+            # The state with unhashable values is not cached
+            template = key = None
+        if template is None:
+            template = self._make_state_template(
+                rtag, {k: ret[k] for k in _STATE_TEMPLATE_KEYS if k in ret}
+            )
+            if key is not None:
+                if len(self._state_templates) >= self._state_templates_size:
+                    # The templates of the states not used anymore are dropped
+                    # with the rest as it's cheaper than tracking their usage
+                    self._state_templates.clear()
+                self._state_templates[key] = template
+        return template
+
+    def parse(self, tag, data, trimmed=None):
         """
         Parse Salt Event data
+
+        :param bool trimmed: If the raw event contains the trimmed values,
+            the data is checked for them if it's not known
         """
 
         fun = data.get("fun")
@@ -62,7 +138,16 @@ class EventParser:
         if (tag_main, tag_sub, fun) in IGNORE_EVENTS:
             return
 
-        ts = get_timestamp(data.get("_stamp"))
+        ts = None
+        if (
+            self.jid_timestamps
+            and tag_main == EventTags.SALT_JOB
+            and tag_sub == EventTags.SALT_JOB_NEW
+        ):
+            # The job is published at the time encoded in its jid
+            ts = get_jid_timestamp(data.get("jid"), utc=self.utc_jid)
+        if ts is None:
+            ts = get_timestamp(data.get("_stamp"))
 
         parsed_data = {
             "tag": tag,
@@ -89,9 +174,16 @@ class EventParser:
             if src is not None:
                 parsed_data[key] = src
 
-        trimmed = list(get_trimmed(data))
-        if trimmed:
-            parsed_data["trimmed"] = trimmed
+        if trimmed is not False:
+            trimmed = list(
+                get_trimmed(
+                    data,
+                    max_depth=self.trimmed_max_depth,
+                    max_paths=self.trimmed_max_paths,
+                )
+            )
+            if trimmed:
+                parsed_data["trimmed"] = trimmed
 
         if tag_main == EventTags.SALT_BATCH and tag_sub in (
             EventTags.SALT_BATCH_START,
@@ -139,41 +231,21 @@ class EventParser:
             and "return" in data
             and isinstance(data["return"], (dict, list))
         ):
+            state_results = None
             if isinstance(data["return"], dict):
                 nchanges = 0
                 duration = 0
                 rcounts = {}
+                if self.compact_state_results:
+                    state_results = []
                 for rtag in data["return"].keys():
                     ret = data["return"][rtag]
                     if not isinstance(ret, dict):
                         continue
                     nchanges += 1 if ret.get("changes") else 0
-                    state_id, state_fun, state_name = split_state_tags(
-                        rtag, ret.get("name")
-                    )
-                    if state_name and "name" not in ret:
-                        ret["name"] = state_name
-                    sls = ret.get("__sls__")
-                    if sls:
-                        _sls = sls.replace("/", ".")
-                        if sls != _sls:
-                            ret["__sls__"] = _sls
-                            ret["__sls_orig__"] = sls
-                        for p, r in self.sls_rules:
-                            if p.match(_sls):
-                                ret["__sls__"] = r
-                                ret["__sls_orig__"] = sls
-                                break
-                    sid = ret.get("__id__", state_id)
-                    if sid:
-                        if "__id__" not in ret:
-                            ret["__id__"] = sid
-                        for p, r in self.sid_rules:
-                            if p.match(sid):
-                                ret["__id__"] = r
-                                ret["__id_orig__"] = sid
-                                break
-                    ret["fun"] = state_fun
+                    state = self._get_state_template(rtag, ret)
+                    ret.update(state)
+                    state_fun = state["fun"]
                     result = ret.get("result")
                     if ret.get("__state_ran__") is False:
                         ret.pop("__state_ran__", None)
@@ -188,6 +260,17 @@ class EventParser:
                     if dur is not None:
                         ret["duration"] = dur
                         duration += dur
+                    if state_results is not None:
+                        state_results.append(
+                            (
+                                ret.get("__sls__"),
+                                ret.get("__id__"),
+                                state_fun,
+                                ret.get("result"),
+                                "warning" in ret,
+                                ret.get("duration", 0.0),
+                            )
+                        )
                 parsed_data["duration"] = duration
                 for result, key in STATE_RESULTS:
                     if result in rcounts:
@@ -197,7 +280,12 @@ class EventParser:
                 parsed_data["changes"] = 1
             elif isinstance(data["return"], list):
                 parsed_data["errors"] = len(data["return"])
-            parsed_data["return"] = data["return"]
+            if state_results is not None:
+                # Pass only the values used for the metrics instead of
+                # the complete state return with changes and comments
+                parsed_data["state_results"] = state_results
+            elif not self.compact_state_results:
+                parsed_data["return"] = data["return"]
 
         if tag_main == EventTags.SALT_STATS:
             parsed_data["stats"] = data.get("stats", {})
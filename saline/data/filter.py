@@ -0,0 +1,143 @@
+import logging
+import re
+
+from functools import lru_cache
+
+from saline.data.rename import _NUMBERED_BACKREF
+
+
+log = logging.getLogger(__name__)
+
+
+__REGEX_SPECIAL = ".^$*+?{}[]|()"
+__REGEX_QUANTIFIERS = "*+?{"
+# The escaped characters which are matching themselves
+__REGEX_ESCAPED_LITERALS = "/.-_:@~^$*+?{}[]|()\\"
+
+
+def _has_top_level_alternation(pattern):
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if in_class:
+            if c == "]":
+                in_class = False
+        elif c == "[":
+            in_class = True
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|" and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+def get_literal_prefix(pattern):
+    """
+    Get the literal prefix every string matching the pattern starts with
+    """
+
+    if _has_top_level_alternation(pattern):
+        return ""
+    prefix = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            if i + 1 < len(pattern) and pattern[i + 1] in __REGEX_ESCAPED_LITERALS:
+                prefix.append(pattern[i + 1])
+                i += 2
+                continue
+            break
+        if c in __REGEX_SPECIAL:
+            if c == "^" and i == 0:
+                i += 1
+                continue
+            if c in __REGEX_QUANTIFIERS and prefix:
+                # The quantifier makes the last literal character optional
+                prefix.pop()
+            break
+        prefix.append(c)
+        i += 1
+    return "".join(prefix)
+
+
+class TagFilterNode:
+    __slots__ = ("children", "patterns", "matchers")
+
+    def __init__(self):
+        self.children = {}
+        self.patterns = []
+        self.matchers = ()
+
+
+class TagFilter:
+    """
+    Compiled matcher of the event tags against the set of regex filters
+    """
+
+    def __init__(self, patterns, cache_size=4096):
+        """
+        Create a Tag Filter object instance
+
+        :param list patterns: The regex filters the tag is allowed to match any of
+        :param int cache_size: The size of LRU cache for the recent tag decisions
+        """
+
+        self._root = TagFilterNode()
+        self._depth = 0
+
+        for pattern in patterns:
+            segments = get_literal_prefix(pattern).split("/")[:-1]
+            node = self._root
+            for segment in segments:
+                node = node.children.setdefault(segment, TagFilterNode())
+            node.patterns.append(pattern)
+            self._depth = max(self._depth, len(segments))
+
+        self._compile(self._root, [])
+
+        if cache_size:
+            self.match = lru_cache(maxsize=cache_size)(self._match)
+        else:
+            self.match = self._match
+
+    def _compile(self, node, patterns):
+        patterns = [*patterns, *node.patterns]
+        # The patterns with the backreferences are matched one by one
+        # as the groups are renumbered in the combined regex
+        combined = [p for p in patterns if not _NUMBERED_BACKREF.search(p)]
+        separate = [re.compile(p) for p in patterns if _NUMBERED_BACKREF.search(p)]
+        if len(combined) > 1:
+            try:
+                node.matchers = (
+                    re.compile("|".join(["(?:%s)" % p for p in combined])),
+                    *separate,
+                )
+            except re.error:
+                # Some patterns could not be combined, use them one by one
+                log.debug("Unable to combine the tag filters: %s", combined)
+                node.matchers = tuple(re.compile(p) for p in patterns)
+        else:
+            node.matchers = tuple(re.compile(p) for p in patterns)
+        for child in node.children.values():
+            self._compile(child, patterns)
+
+    def _match(self, tag):
+        node = self._root
+        for segment in tag.split("/", self._depth)[:-1]:
+            child = node.children.get(segment)
+            if child is None:
+                break
+            node = child
+        for matcher in node.matchers:
+            if matcher.match(tag):
+                return True
+        return False
@@ -1,17 +1,168 @@
 import logging
 
-from time import time
+from threading import Lock
+from time import monotonic, time
 
 from saline.data.metrics import Metrics, MetricsCollection
 from saline.data.minion import MinionsCollection
 from saline.data.parser import EventTags
-from saline.data.smart import MergeWrapper
-from saline.data.state import StateJobCollection, JobStatus
+from saline.data.state import JobStatus, StateJobCollection, StateResultsRegistry
 
 
 log = logging.getLogger(__name__)
 
 
+STATE_STATUSES = (
+    "succeeded",
+    "failed",
+    "notrun",
+    "warning",
+)
+
+
+STATE_RESULT_STATUSES = {
+    True: "succeeded",
+    False: "failed",
+    None: "notrun",
+}
+
+
+STATE_FUNCS = (
+    "state.apply",
+    "state.high",
+    "state.highstate",
+    "state.low",
+    "state.pkg",
+    "state.template",
+    "state.template_str",
+    "state.test",
+    "state.top",
+    "state.single",
+    "state.sls",
+    "state.sls_id",
+)
+
+
+def get_state_results(data):
+    """
+    Get the compact state results from the parsed data
+    or from the full state return
+    """
+
+    state_results = data.get("state_results")
+    if state_results is not None:
+        return state_results
+    if "return" in data and isinstance(data["return"], dict):
+        return [
+            (
+                ret.get("__sls__"),
+                ret.get("__id__"),
+                ret.get("fun"),
+                ret.get("result"),
+                "warning" in ret,
+                ret.get("duration", 0.0),
+            )
+            for ret in data["return"].values()
+        ]
+    return ()
+
+
+def get_state_apply_status(data):
+    """
+    Get the job status of the state apply and the statuses to count it with
+    """
+
+    if data.get("errors"):
+        return JobStatus.FAILED, ("errors",)
+    if data.get("test", False):
+        return JobStatus.SUCCEEDED, ("test",)
+    statuses = tuple(s for s in STATE_STATUSES if data.get(s))
+    if "failed" in statuses:
+        return JobStatus.FAILED, statuses
+    return JobStatus.SUCCEEDED, statuses
+
+
+def count_event(data, inc):
+    """
+    Count the event with the counters not depending on the data merger state,
+    the state results are counted with the original sls, sid, fun and status
+
+    :param dict data: The parsed event data
+    :param callable inc: The function to increment the metric with
+        the metric, labels and the value to increment by
+    """
+
+    rix = data.get("rix")
+    if rix is not None:
+        inc(Metrics.SALINE_INTERNAL_RIX_TOTAL, (rix,))
+    # The sampled event is counted as the number of the events it stands for
+    weight = data.get("weight", 1)
+    inc(Metrics.SALT_EVENTS_TOTAL, None, weight)
+    tag_mask = data.get("tag_mask")
+    inc(Metrics.SALT_EVENTS_TAGS, (tag_mask,), weight)
+    fun = data.get("fun")
+    inc(Metrics.SALT_EVENTS_TAGS_FUNCS, (tag_mask, fun if fun else "-"), weight)
+    if (
+        fun in STATE_FUNCS
+        and data.get("tag_main") == EventTags.SALT_JOB
+        and data.get("tag_sub") == EventTags.SALT_JOB_RET
+        and data.get("offline", False) is False
+    ):
+        inc(Metrics.SALT_STATE_APPLIES, None, weight)
+        _, statuses = get_state_apply_status(data)
+        for status in statuses:
+            inc(Metrics.SALT_STATE_APPLIES_STATUS, (status,), weight)
+        if not data.get("errors"):
+            test = data.get("test", False)
+            for sls, sid, fun, result, warning, duration in get_state_results(data):
+                if test:
+                    status = "notrun"
+                else:
+                    status = STATE_RESULT_STATUSES[result]
+                    if warning:
+                        status = "%s_with_warning" % status
+                labels = (sls, sid, fun, status)
+                inc(Metrics.SALT_STATE_RESULTS, labels, weight)
+                inc(Metrics.SALT_STATE_DURATION, labels, duration * weight)
+    trimmed = data.get("trimmed")
+    if trimmed:
+        inc(Metrics.SALT_EVENTS_TRIMMED_COUNT, None, weight)
+        inc(Metrics.SALT_EVENTS_TRIMMED_TOTAL, None, len(trimmed) * weight)
+
+
+class EventsAggregator:
+    """
+    Aggregate the counters of the parsed events to pass them to the data merger
+    as the deltas instead of counting each event by the data merger
+    """
+
+    def __init__(self):
+        self._deltas = {}
+
+    def __len__(self):
+        return len(self._deltas)
+
+    def inc(self, metric, labels=None, inc_by=1):
+        key = (metric, labels)
+        self._deltas[key] = self._deltas.get(key, 0) + inc_by
+
+    def add(self, data):
+        """
+        Count the parsed event and strip the data counted already
+        """
+
+        count_event(data, self.inc)
+        data["counted"] = True
+        data.pop("state_results", None)
+        data.pop("return", None)
+        return data
+
+    def pop_deltas(self):
+        deltas = self._deltas
+        self._deltas = {}
+        return deltas
+
+
 class DataMerger:
     def __init__(self, opts):
         self.opts = opts
@@ -19,63 +170,24 @@ class DataMerger:
         self.minions = MinionsCollection()
         self.jobs = StateJobCollection(self.minions)
         self.states_mods = {}
-        self._state_statuses = (
-            "succeeded",
-            "failed",
-            "notrun",
-            "warning",
-        )
-        self._status_tgt = {
-            True: "succeeded",
-            False: "failed",
-            None: "notrun",
-        }
-        self._sls_id_fun = MergeWrapper(
-            {},
-            self.opts.get("merge_rules", {}).get("sls", {}).get("start_merging_on", 70),
+        merge_rules = self.opts.get("merge_rules", {})
+        self._state_results = StateResultsRegistry(
+            sls_merging_on=merge_rules.get("sls", {}).get("start_merging_on", 70),
+            sid_merging_on=merge_rules.get("sid", {}).get("start_merging_on", 150),
             new_rules_callback=self._new_merge_rules,
-            new_rules_callback_opts=("sls",),
-            merge_callback=self._merge_sls,
-        )
-        self._state_funcs = (
-            "state.apply",
-            "state.high",
-            "state.highstate",
-            "state.low",
-            "state.pkg",
-            "state.template",
-            "state.template_str",
-            "state.test",
-            "state.top",
-            "state.single",
-            "state.sls",
-            "state.sls_id",
+            move_callback=self._move_metrics,
+            cache_size=self.opts.get("state_labels_cache_size", 65536),
+            merge_deferred=self.opts.get("merging_background", True),
         )
-
-    def _get_sls_id_fun_status(self, sls, sid, fun, status):
-        (sls, sid, fun) = (str(sls), str(sid), str(fun))
-        sls = self._sls_id_fun.get_wrapped(sls)
-        if sls not in self._sls_id_fun:
-            self._sls_id_fun[sls] = MergeWrapper(
-                {},
-                self.opts.get("merge_rules", {})
-                .get("sid", {})
-                .get("start_merging_on", 150),
-                new_rules_callback=self._new_merge_rules,
-                new_rules_callback_opts=("sid",),
-                merge_callback=self._merge_sls_sid,
-                merge_callback_opts=(sls,),
-            )
-            sls = self._sls_id_fun.get_wrapped(sls)
-        sid = self._sls_id_fun[sls].get_wrapped(sid)
-        if sid not in self._sls_id_fun[sls]:
-            self._sls_id_fun[sls][sid] = {}
-            sid = self._sls_id_fun[sls].get_wrapped(sid)
-        if fun not in self._sls_id_fun[sls][sid]:
-            self._sls_id_fun[sls][sid][fun] = []
-        if status not in self._sls_id_fun[sls][sid][fun]:
-            self._sls_id_fun[sls][sid][fun].append(status)
-        return (sls, sid, fun, status)
+        # Held while adding the events and while applying the merging rules
+        self._lock = Lock()
+        # The last state labels mapped to the merged ones
+        self._state_labels = (None, None)
+        # The counters, the latency observations and the internal gauges
+        # accumulated by add_many to apply them at once
+        self._deltas = None
+        self._observations = None
+        self._values = None
 
     def _new_merge_rules(self, new_rules, rule_for):
         for pattern, replacement in new_rules:
@@ -87,6 +199,9 @@ class DataMerger:
             )
 
     def _move_metrics(self, src_labels, dst_labels):
+        # The accumulated counters could be of the labels being moved
+        self._flush_deltas()
+        self._state_labels = (None, None)
         self.metrics.move(
             (
                 Metrics.SALT_STATE_RESULTS,
@@ -96,47 +211,6 @@ class DataMerger:
             dst_labels,
         )
 
-    def _merge_sls(self, src_sls, dst_sls):
-        for sid in list(self._sls_id_fun[src_sls].keys()):
-            self._merge_sls_sid(sid, sid, src_sls, dst_sls)
-        self._sls_id_fun.pop(src_sls, None)
-        return True
-
-    def _merge_sls_sid(self, src_sid, dst_sid, src_sls, dst_sls=None):
-        if dst_sls is None:
-            dst_sls = src_sls
-        else:
-            if dst_sls not in self._sls_id_fun:
-                self._sls_id_fun[dst_sls] = MergeWrapper(
-                    {},
-                    self.opts.get("merge_rules", {})
-                    .get("sid", {})
-                    .get("start_merging_on", 150),
-                    new_rules_callback=self._new_merge_rules,
-                    new_rules_callback_opts=("sid",),
-                    merge_callback=self._merge_sls_sid,
-                    merge_callback_opts=(dst_sls,),
-                )
-        if dst_sid not in self._sls_id_fun[dst_sls]:
-            self._sls_id_fun[dst_sls][dst_sid] = {}
-        for fun in self._sls_id_fun[src_sls][src_sid]:
-            if fun not in self._sls_id_fun[dst_sls][dst_sid]:
-                self._sls_id_fun[dst_sls][dst_sid][fun] = []
-            for status in self._sls_id_fun[src_sls][src_sid][fun]:
-                self._move_metrics(
-                    (src_sls, src_sid, fun, status), (dst_sls, dst_sid, fun, status)
-                )
-            self._sls_id_fun[dst_sls][dst_sid][fun] = list(
-                set(
-                    [
-                        *self._sls_id_fun[src_sls][src_sid][fun],
-                        *self._sls_id_fun[dst_sls][dst_sid][fun],
-                    ]
-                )
-            )
-        self._sls_id_fun[src_sls].pop(src_sid, None)
-        return True
-
     def _store_per_minion_state_data(self, minions, status, jid, ts, state_fun_args):
         if state_fun_args is None:
             log.warning("Ignoring state data for %s from jid: %s", minions, jid)
@@ -166,60 +240,7 @@ class DataMerger:
                 data.get("state_fun_args"),
             )
             return
-        self.metrics.inc(Metrics.SALT_STATE_APPLIES)
-        state_status = None
-        errors = data.get("errors")
-        if errors:
-            self.metrics.inc(Metrics.SALT_STATE_APPLIES_STATUS, ("errors",))
-            state_status = JobStatus.FAILED
-        elif data.get("test", False):
-            self.metrics.inc(Metrics.SALT_STATE_APPLIES_STATUS, ("test",))
-            if "return" in data and isinstance(data["return"], dict):
-                for rtag in data["return"].keys():
-                    ret = data["return"][rtag]
-                    duration = ret.get("duration", 0.0)
-                    sls_id_fun_status = self._get_sls_id_fun_status(
-                        ret.get("__sls__"), ret.get("__id__"), ret.get("fun"), "notrun"
-                    )
-                    self.metrics.inc(
-                        Metrics.SALT_STATE_RESULTS,
-                        sls_id_fun_status,
-                    )
-                    self.metrics.inc(
-                        Metrics.SALT_STATE_DURATION,
-                        sls_id_fun_status,
-                        inc_by=duration,
-                    )
-            state_status = JobStatus.SUCCEEDED
-        else:
-            for s in self._state_statuses:
-                vl = data.get(s)
-                if vl:
-                    self.metrics.inc(Metrics.SALT_STATE_APPLIES_STATUS, (s,))
-                    if s == "failed":
-                        state_status = JobStatus.FAILED
-            if "return" in data and isinstance(data["return"], dict):
-                for rtag in data["return"].keys():
-                    ret = data["return"][rtag]
-                    result = ret.get("result")
-                    status = self._status_tgt[result]
-                    if "warning" in ret:
-                        status = "%s_with_warning" % status
-                    duration = ret.get("duration", 0.0)
-                    sls_id_fun_status = self._get_sls_id_fun_status(
-                        ret.get("__sls__"), ret.get("__id__"), ret.get("fun"), status
-                    )
-                    self.metrics.inc(
-                        Metrics.SALT_STATE_RESULTS,
-                        sls_id_fun_status,
-                    )
-                    self.metrics.inc(
-                        Metrics.SALT_STATE_DURATION,
-                        sls_id_fun_status,
-                        inc_by=duration,
-                    )
-            if state_status != JobStatus.FAILED:
-                state_status = JobStatus.SUCCEEDED
+        state_status, _ = get_state_apply_status(data)
         self._store_per_minion_state_data(
             minions,
             state_status,
@@ -228,25 +249,90 @@ class DataMerger:
             data.get("state_fun_args"),
         )
 
+    def add_internal(self, internal):
+        for (metric, labels), value in internal.items():
+            self.metrics.set(metric, labels, value)
+
+    def _inc(self, metric, labels=None, inc_by=1):
+        if metric in (Metrics.SALT_STATE_RESULTS, Metrics.SALT_STATE_DURATION):
+            # The results and the duration of the state are counted one by one
+            # with the same labels, map them to the merged ones only once
+            if labels is not self._state_labels[0]:
+                self._state_labels = (labels, self._state_results.get(labels))
+            labels = self._state_labels[1]
+        if self._deltas is not None:
+            key = (metric, labels)
+            self._deltas[key] = self._deltas.get(key, 0) + inc_by
+            return
+        self.metrics.inc(metric, labels, inc_by=inc_by)
+
+    def _flush_deltas(self):
+        if self._deltas:
+            self.metrics.inc_many(self._deltas)
+            self._deltas = {}
+
+    def add_deltas(self, deltas):
+        for (metric, labels), value in deltas.items():
+            self._inc(metric, labels, value)
+
+    def add_many(self, events):
+        """
+        Merge the batch of the events applying their counters
+        to the metrics with one bulk update
+
+        :param list events: The parsed events data
+        """
+
+        with self._lock:
+            self._deltas = {}
+            self._observations = []
+            self._values = {}
+            try:
+                for data in events:
+                    self._add(data)
+            finally:
+                deltas, self._deltas = self._deltas, None
+                observations, self._observations = self._observations, None
+                values, self._values = self._values, None
+                self.metrics.inc_many(deltas, observations, values)
+
+    def merge_pending(self, budget=None):
+        """
+        Merge the similar sls and sid values added since the last call
+
+        :param float budget: The seconds to stop starting the merges after,
+            all of the pending values are merged if not specified
+
+        :return: The number of the values sets still pending merging
+        """
+
+        return self._state_results.merge_pending(self._lock, budget=budget)
+
     def add(self, data):
-        rix = data.get("rix")
-        if rix is not None:
-            self.metrics.inc(Metrics.SALINE_INTERNAL_RIX_TOTAL, (rix,))
+        self.add_many((data,))
+
+    def _add(self, data):
+        internal = data.get("internal")
+        if internal is not None:
+            self.add_internal(internal)
+            return
+        deltas = data.get("deltas")
+        if deltas is not None:
+            self.add_deltas(deltas)
+            return
+        if not data.get("counted", False):
+            count_event(data, self._inc)
         jid = data.get("jid")
-        self.metrics.inc(Metrics.SALT_EVENTS_TOTAL)
         ts = data.get("ts")
         tag_main = data.get("tag_main")
         tag_sub = data.get("tag_sub")
-        tag_mask = data.get("tag_mask")
-        self.metrics.inc(Metrics.SALT_EVENTS_TAGS, (tag_mask,))
         fun = data.get("fun")
         if fun:
-            self.metrics.inc(Metrics.SALT_EVENTS_TAGS_FUNCS, (tag_mask, fun))
             if (
                 tag_main == EventTags.SALT_JOB
                 and tag_sub in (EventTags.SALT_JOB_NEW, EventTags.SALT_JOB_RET)
             ):
-                if fun in self._state_funcs and data.get("offline", False) is False:
+                if fun in STATE_FUNCS and data.get("offline", False) is False:
                     self._add_state(data, tag_sub, ts)
                 else:
                     minions = []
@@ -267,8 +353,6 @@ class DataMerger:
                             else JobStatus.FAILED,
                             jid=jid,
                         )
-        else:
-            self.metrics.inc(Metrics.SALT_EVENTS_TAGS_FUNCS, (tag_mask, "-"))
         if tag_main in (
             EventTags.SALT_AUTH,
             EventTags.SALT_MINION_START,
@@ -316,8 +400,43 @@ class DataMerger:
                 jid,
                 ", ".join(trimmed),
             )
-            self.metrics.inc(Metrics.SALT_EVENTS_TRIMMED_COUNT)
-            self.metrics.inc(Metrics.SALT_EVENTS_TRIMMED_TOTAL, inc_by=len(trimmed))
+        stamps = data.get("stamps")
+        if stamps:
+            self._observe_latency(stamps, ts)
+
+    def _observe_latency(self, stamps, ts):
+        # The values are applied with the counters of the batch, but
+        # do not update the metrics epoch to avoid republishing the metrics
+        # on each event just because of these values changed, the events
+        # are counted with the other metrics updating the epoch anyway
+        merged = monotonic()
+        received, filtered, parsed = stamps
+        latency = Metrics.SALINE_INTERNAL_PIPELINE_LATENCY
+        self._observations.extend(
+            (
+                (latency, ("filter",), filtered - received),
+                (latency, ("parse",), parsed - filtered),
+                (latency, ("merge",), merged - parsed),
+                (latency, ("total",), merged - received),
+            )
+        )
+        if ts is not None:
+            # Only the lag of the last event of the batch is reported
+            self._values[(Metrics.SALINE_INTERNAL_EVENTS_LAG, None)] = time() - ts
+
+    def metrics_published(self, ts, duration):
+        # Do not update the metrics epoch to avoid republishing
+        # the metrics just because of these values changed
+        self.metrics.set(
+            Metrics.SALINE_INTERNAL_METRICS_PUBLISH_TIMESTAMP,
+            value=ts,
+            update_epoch=False,
+        )
+        self.metrics.set(
+            Metrics.SALINE_INTERNAL_METRICS_PUBLISH_DURATION,
+            value=duration,
+            update_epoch=False,
+        )
 
     def get_metrics(self):
         return self.metrics.get_buf()
@@ -1,3 +1,4 @@
+from bisect import bisect_left
 from threading import Lock
 
 
@@ -5,6 +6,7 @@ class Metrics:
     # Define Metric types
     TYPE_COUNTER = 1
     TYPE_GAUGE = 2
+    TYPE_HISTOGRAM = 3
     # Define Metric IDs
     SALT_EVENTS_TOTAL = 1
     SALT_EVENTS_TAGS = 2
@@ -22,6 +24,19 @@ class Metrics:
     SALT_STATS_TOTAL = 14
     # IDs for internal metrics
     SALINE_INTERNAL_RIX_TOTAL = 100
+    SALINE_INTERNAL_EVENTS_BUFFER_DEPTH = 101
+    SALINE_INTERNAL_EVENTS_BUFFER_DROPPED = 102
+    SALINE_INTERNAL_EVENTS_BUFFER_SPILLED = 103
+    SALINE_INTERNAL_QUEUE_RECORDS = 104
+    SALINE_INTERNAL_QUEUE_FILL_BYTES = 105
+    SALINE_INTERNAL_READERS = 106
+    SALINE_INTERNAL_READERS_SCALED = 107
+    SALINE_INTERNAL_PIPELINE_LATENCY = 108
+    SALINE_INTERNAL_EVENTS_LAG = 109
+    SALINE_INTERNAL_METRICS_PUBLISH_DURATION = 110
+    SALINE_INTERNAL_METRICS_PUBLISH_TIMESTAMP = 111
+    SALINE_INTERNAL_CACHE_LOOKUPS = 112
+    SALINE_INTERNAL_EVENTS_SHED = 113
     # Metric labels definitions
     LABEL_TAG = 1
     LABEL_FUN = 2
@@ -33,14 +48,41 @@ class Metrics:
     LABEL_MASTER_CMD = 50
     # IDs for labels of internal metrics
     LABEL_RIX = 100
+    LABEL_STORAGE = 101
+    LABEL_QUEUE = 102
+    LABEL_DIRECTION = 103
+    LABEL_STAGE = 104
+    LABEL_CACHE = 105
+    LABEL_RESULT = 106
+    LABEL_CLASS = 107
+    LABEL_ACTION = 108
 
 
 TYPE_LABELS = {
     Metrics.TYPE_COUNTER: "counter",
     Metrics.TYPE_GAUGE: "gauge",
+    Metrics.TYPE_HISTOGRAM: "histogram",
 }
 
 
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
 LABELS_STATUS = ((Metrics.LABEL_STATUS, "status"),)
 
 
@@ -132,6 +174,88 @@ METRICS = {
         "Total number of events processed by specific reader",
         ((Metrics.LABEL_RIX, "rix"),),
     ),
+    Metrics.SALINE_INTERNAL_EVENTS_BUFFER_DEPTH: (
+        Metrics.TYPE_GAUGE,
+        "saline_internal_events_buffer_depth",
+        "The number of events waiting in the events manager buffer",
+        ((Metrics.LABEL_STORAGE, "storage"),),
+    ),
+    Metrics.SALINE_INTERNAL_EVENTS_BUFFER_DROPPED: (
+        Metrics.TYPE_COUNTER,
+        "saline_internal_events_buffer_dropped_total",
+        "Total number of events dropped on the events manager buffer overflow",
+        None,
+    ),
+    Metrics.SALINE_INTERNAL_EVENTS_BUFFER_SPILLED: (
+        Metrics.TYPE_COUNTER,
+        "saline_internal_events_buffer_spilled_total",
+        "Total number of events spilled to the file on the events manager buffer overflow",
+        None,
+    ),
+    Metrics.SALINE_INTERNAL_QUEUE_RECORDS: (
+        Metrics.TYPE_GAUGE,
+        "saline_internal_queue_records",
+        "The number of records waiting in the queue between the processes",
+        ((Metrics.LABEL_QUEUE, "queue"),),
+    ),
+    Metrics.SALINE_INTERNAL_QUEUE_FILL_BYTES: (
+        Metrics.TYPE_GAUGE,
+        "saline_internal_queue_fill_bytes",
+        "The number of bytes used in the shared memory queue between the processes",
+        ((Metrics.LABEL_QUEUE, "queue"),),
+    ),
+    Metrics.SALINE_INTERNAL_READERS: (
+        Metrics.TYPE_GAUGE,
+        "saline_internal_readers",
+        "The number of running events readers",
+        None,
+    ),
+    Metrics.SALINE_INTERNAL_READERS_SCALED: (
+        Metrics.TYPE_COUNTER,
+        "saline_internal_readers_scaled_total",
+        "Total number of events readers autoscaling decisions by direction",
+        ((Metrics.LABEL_DIRECTION, "direction"),),
+    ),
+    Metrics.SALINE_INTERNAL_PIPELINE_LATENCY: (
+        Metrics.TYPE_HISTOGRAM,
+        "saline_internal_pipeline_latency_seconds",
+        "The latency of the events processing pipeline stages",
+        ((Metrics.LABEL_STAGE, "stage"),),
+    ),
+    Metrics.SALINE_INTERNAL_EVENTS_LAG: (
+        Metrics.TYPE_GAUGE,
+        "saline_internal_events_lag_seconds",
+        "The time between firing the last merged event and merging it",
+        None,
+    ),
+    Metrics.SALINE_INTERNAL_METRICS_PUBLISH_DURATION: (
+        Metrics.TYPE_GAUGE,
+        "saline_internal_metrics_publish_duration_seconds",
+        "The time taken by the last metrics publishing",
+        None,
+    ),
+    Metrics.SALINE_INTERNAL_METRICS_PUBLISH_TIMESTAMP: (
+        Metrics.TYPE_GAUGE,
+        "saline_internal_metrics_publish_timestamp_seconds",
+        "The time of the last metrics publishing",
+        None,
+    ),
+    Metrics.SALINE_INTERNAL_CACHE_LOOKUPS: (
+        Metrics.TYPE_COUNTER,
+        "saline_internal_cache_lookups_total",
+        "Total number of the events readers cache lookups by result",
+        (
+            (Metrics.LABEL_RIX, "rix"),
+            (Metrics.LABEL_CACHE, "cache"),
+            (Metrics.LABEL_RESULT, "result"),
+        ),
+    ),
+    Metrics.SALINE_INTERNAL_EVENTS_SHED: (
+        Metrics.TYPE_COUNTER,
+        "saline_internal_events_shed_total",
+        "Total number of the events shed on overload by tag class and action",
+        ((Metrics.LABEL_CLASS, "class"), (Metrics.LABEL_ACTION, "action")),
+    ),
     Metrics.SALT_MINIONS: (
         Metrics.TYPE_GAUGE,
         "salt_minions",
@@ -159,73 +283,280 @@ METRICS = {
 }
 
 
-class MetricsLabeledEntry:
-    def __init__(self, labels_defs, labels, lock):
-        self.value = 0
-        self._lock = lock
-        ls = []
-        i = 0
-        for li, lv in labels_defs:
-            ls.append(
-                '%s="%s"'
-                % (
-                    lv,
-                    str(labels[i]).replace('"', '\\"'),
-                )
-            )
-            i += 1
-        self.labels = ",".join(ls)
+HISTOGRAM_BUCKETS = {
+    Metrics.SALINE_INTERNAL_PIPELINE_LATENCY: LATENCY_BUCKETS,
+}
 
-    def inc(self, inc_by=1):
-        return self.set(inc_by=inc_by)
 
-    def set(self, value=None, inc_by=None):
-        old_value = self.value
-        if value is not None:
-            self.value = value
-        elif inc_by is not None:
-            self.value += inc_by
-        return old_value
+class MetricsHistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def copy(self):
+        hv = MetricsHistogramValue(self.buckets)
+        hv.counts = self.counts.copy()
+        hv.sum = self.sum
+        hv.count = self.count
+        return hv
+
+    def lines(self, label, labels):
+        b = []
+        lp = "%s," % labels if labels else ""
+        count = 0
+        for le, le_count in zip(self.buckets, self.counts):
+            count += le_count
+            b.append(f'{label}_bucket{{{lp}le="{le}"}} {count}')
+        b.append(f'{label}_bucket{{{lp}le="+Inf"}} {self.count}')
+        ls = "{%s}" % labels if labels else ""
+        b.append(f"{label}_sum{ls} %.6f" % self.sum)
+        b.append(f"{label}_count{ls} {self.count}")
+        return b
+
+
+class LabelsDict:
+    """
+    Interning of the label values to the small integers,
+    the labels of the metric are stored as one integer
+    packed from the integers of the values
+    """
+
+    BITS = 32
+    MASK = (1 << BITS) - 1
+
+    def __init__(self):
+        self._ids = {}
+        # The label values escaped for rendering by the integers
+        self._values = []
+        # The label values and the number of the series using them by the integers,
+        # the integers of the values not used anymore are reused for the new ones
+        self._keys = []
+        self._refs = []
+        self._free = []
+
+    def __len__(self):
+        return len(self._ids)
+
+    def pack(self, labels, add=True):
+        """
+        Get the integer for the label values
+
+        :param tuple labels: The label values
+        :param bool add: Intern the values not seen before,
+            otherwise return None if any of the values is not known
+        """
+
+        key = 0
+        shift = 0
+        for value in labels:
+            value = str(value)
+            idx = self._ids.get(value)
+            if idx is None:
+                if not add:
+                    return None
+                idx = self._intern(value)
+            key |= idx << shift
+            shift += self.BITS
+        return key
+
+    def _intern(self, value):
+        escaped = value.replace('"', '\\"')
+        if self._free:
+            idx = self._free.pop()
+            self._values[idx] = escaped
+            self._keys[idx] = value
+            self._refs[idx] = 0
+        else:
+            idx = len(self._values)
+            self._values.append(escaped)
+            self._keys.append(value)
+            self._refs.append(0)
+        self._ids[value] = idx
+        return idx
+
+    def ref(self, key, count):
+        """
+        Count the new series using the packed label values
+
+        :param int key: The packed label values
+        :param int count: The number of the label values in the key
+        """
+
+        refs = self._refs
+        for i in range(count):
+            refs[(key >> (i * self.BITS)) & self.MASK] += 1
+
+    def unref(self, key, count):
+        """
+        Release the packed label values of the removed series,
+        the values not used by any series are dropped
+
+        :param int key: The packed label values
+        :param int count: The number of the label values in the key
+        """
+
+        refs = self._refs
+        for i in range(count):
+            idx = (key >> (i * self.BITS)) & self.MASK
+            refs[idx] -= 1
+            if refs[idx] == 0:
+                del self._ids[self._keys[idx]]
+                self._values[idx] = None
+                self._keys[idx] = None
+                self._free.append(idx)
+
+    def get_values(self):
+        """
+        Get the copy of the escaped label values to render the labels with
+        """
+
+        return self._values.copy()
+
+    def get_prefixes(self, names):
+        """
+        Get the rendering prefixes for the names of the labels
+        """
+
+        return tuple(('%s="' % name, i * self.BITS) for i, name in enumerate(names))
+
+    def render(self, key, prefixes, values=None):
+        """
+        Render the packed labels in Prometheus text format
+
+        :param int key: The packed label values
+        :param tuple prefixes: The rendering prefixes of the labels
+        :param list values: The copy of the label values to render with
+        """
+
+        if values is None:
+            values = self._values
+        mask = self.MASK
+        return ",".join(
+            [prefix + values[(key >> shift) & mask] + '"' for prefix, shift in prefixes]
+        )
 
 
 class MetricsEntry:
-    def __init__(self, metric, lock):
+    def __init__(self, metric, lock, labels_dict=None):
         self.mtype, self.label, self.doc, self._labels_defs = METRICS[metric]
         self._lock = lock
         self.value = None
+        self._buckets = HISTOGRAM_BUCKETS.get(metric)
         # The entries with None in the value are labeled
         if self._labels_defs is None:
             # If there is no labels definitions set it as non labeled
-            self.value = 0
+            self.value = (
+                0
+                if self.mtype != Metrics.TYPE_HISTOGRAM
+                else MetricsHistogramValue(self._buckets)
+            )
         else:
+            self._labels_dict = LabelsDict() if labels_dict is None else labels_dict
+            self._label_prefixes = self._labels_dict.get_prefixes(
+                lv for _, lv in self._labels_defs
+            )
+            self._labels_count = len(self._labels_defs)
+            # The values keyed with the packed labels
             self._labels = {}
 
     def __str__(self):
+        return self.render(self.snapshot())
+
+    def snapshot(self):
+        """
+        Copy the values of the entry to render them without holding the lock
+        """
+
+        if self.value is None:
+            if self.mtype == Metrics.TYPE_HISTOGRAM:
+                return {key: value.copy() for key, value in self._labels.items()}
+            return self._labels.copy()
+        if self.mtype == Metrics.TYPE_HISTOGRAM:
+            return self.value.copy()
+        return self.value
+
+    def render(self, snapshot, label_values=None):
+        """
+        Render the values of the entry in Prometheus text format
+
+        :param snapshot: The values of the entry copied with ``snapshot``
+        :param list label_values: The copy of the label values to render with
+        """
+
         b = []
         b.append(f"# HELP {self.label} {self.doc}")
         b.append(f"# TYPE {self.label} {TYPE_LABELS[self.mtype]}")
-        if self.value is None:
-            for le in self._labels.values():
-                v = "%.3f" % le.value if isinstance(le.value, float) else le.value
-                b.append(f"{self.label}{{{le.labels}}} {v}")
+        if self.mtype == Metrics.TYPE_HISTOGRAM:
+            if self.value is None:
+                for key, value in snapshot.items():
+                    b.extend(
+                        value.lines(
+                            self.label,
+                            self._labels_dict.render(
+                                key, self._label_prefixes, label_values
+                            ),
+                        )
+                    )
+            else:
+                b.extend(snapshot.lines(self.label, None))
+        elif self.value is None:
+            for key, value in snapshot.items():
+                v = "%.3f" % value if isinstance(value, float) else value
+                ls = self._labels_dict.render(key, self._label_prefixes, label_values)
+                b.append(f"{self.label}{{{ls}}} {v}")
         else:
-            v = "%.3f" % self.value if isinstance(self.value, float) else self.value
+            v = "%.3f" % snapshot if isinstance(snapshot, float) else snapshot
             b.append(f"{self.label} {v}")
         b.append("")
         return "\n".join(b)
 
     def _set_labeled(self, labels, value=None, inc_by=None):
         with self._lock:
-            if labels in self._labels:
-                le = self._labels[labels]
+            key = self._labels_dict.pack(labels)
+            old_value = self._labels.get(key)
+            if old_value is None:
+                old_value = 0
+                self._labels_dict.ref(key, self._labels_count)
+            if value is not None:
+                self._labels[key] = value
+            elif inc_by is not None:
+                self._labels[key] = old_value + inc_by
             else:
-                le = MetricsLabeledEntry(self._labels_defs, labels, self._lock)
-                self._labels[labels] = le
-        return le.set(value, inc_by)
+                self._labels[key] = old_value
+        return old_value
 
     def inc(self, labels, inc_by):
         return self.set(labels, inc_by=inc_by)
 
+    def inc_unlocked(self, labels, inc_by):
+        """
+        Increment the value with the lock already acquired by the caller
+        """
+
+        if self.value is None:
+            # The entries with None in the value are labeled
+            if labels is None:
+                raise KeyError
+            key = self._labels_dict.pack(labels)
+            old_value = self._labels.get(key)
+            if old_value is None:
+                old_value = 0
+                self._labels_dict.ref(key, self._labels_count)
+            self._labels[key] = old_value + inc_by
+        else:
+            if labels is not None:
+                raise KeyError
+            self.value += inc_by
+
     def set(self, labels, value=None, inc_by=None):
         old_value = None
         if self.value is None:
@@ -244,16 +575,62 @@ class MetricsEntry:
                     self.value += inc_by
         return old_value
 
+    def set_unlocked(self, labels, value):
+        """
+        Set the value with the lock already acquired by the caller
+        """
+
+        if self.value is None:
+            # The entries with None in the value are labeled
+            if labels is None:
+                raise KeyError
+            key = self._labels_dict.pack(labels)
+            if self._labels.get(key) is None:
+                self._labels_dict.ref(key, self._labels_count)
+            self._labels[key] = value
+        else:
+            if labels is not None:
+                raise KeyError
+            self.value = value
+
+    def observe(self, labels, value):
+        with self._lock:
+            self.observe_unlocked(labels, value)
+
+    def observe_unlocked(self, labels, value):
+        """
+        Observe the value with the lock already acquired by the caller
+        """
+
+        if self.value is None:
+            # The entries with None in the value are labeled
+            if labels is None:
+                raise KeyError
+            key = self._labels_dict.pack(labels)
+            hv = self._labels.get(key)
+            if hv is None:
+                hv = MetricsHistogramValue(self._buckets)
+                self._labels[key] = hv
+                self._labels_dict.ref(key, self._labels_count)
+            hv.observe(value)
+        else:
+            self.value.observe(value)
+
     def move(self, src_labels, dst_labels):
-        if self.value is not None:
+        if self.value is not None or self.mtype == Metrics.TYPE_HISTOGRAM:
             return
         value = None
         with self._lock:
-            if src_labels in self._labels:
-                value = self._labels.pop(src_labels).value
+            key = self._labels_dict.pack(src_labels, add=False)
+            if key is not None:
+                value = self._labels.pop(key, None)
         if value is None:
             return
         self._set_labeled(dst_labels, inc_by=value)
+        with self._lock:
+            # Drop the label values not used by the other series anymore,
+            # the values used by the destination are referenced already
+            self._labels_dict.unref(key, self._labels_count)
 
 
 class MetricsCollection:
@@ -261,6 +638,8 @@ class MetricsCollection:
         self._epoch = 0
         self._lock = Lock()
         self.metrics = {}
+        # The label values shared by all of the metrics
+        self.labels = LabelsDict()
 
     def get_epoch(self):
         return self._epoch
@@ -268,16 +647,25 @@ class MetricsCollection:
     def inc(self, metric, labels=None, inc_by=1):
         return self.set(metric, labels, inc_by=inc_by)
 
-    def set(self, metric, labels=None, value=None, inc_by=None):
+    def _get_entry(self, metric):
         with self._lock:
             if metric in self.metrics:
                 me = self.metrics[metric]
             else:
-                me = MetricsEntry(metric, self._lock)
+                me = MetricsEntry(metric, self._lock, self.labels)
                 self.metrics[metric] = me
+        return me
+
+    def observe(self, metric, labels=None, value=0, update_epoch=True):
+        self._get_entry(metric).observe(labels, value)
+        if update_epoch:
+            self._epoch += 1
+
+    def set(self, metric, labels=None, value=None, inc_by=None, update_epoch=True):
+        me = self._get_entry(metric)
         if value is not None:
             old_value = me.set(labels, value)
-            if old_value != value:
+            if old_value != value and update_epoch:
                 self._epoch += 1
             return old_value
         elif inc_by is not None:
@@ -285,6 +673,38 @@ class MetricsCollection:
             self._epoch += 1
             return old_value
 
+    def _get_entry_unlocked(self, metric):
+        me = self.metrics.get(metric)
+        if me is None:
+            me = MetricsEntry(metric, self._lock, self.labels)
+            self.metrics[metric] = me
+        return me
+
+    def inc_many(self, deltas, observations=None, values=None):
+        """
+        Increment the metrics with one lock acquisition
+
+        :param dict deltas: The values to increment by keyed with (metric, labels)
+        :param list observations: The (metric, labels, value) histogram
+            observations to apply without updating the epoch
+        :param dict values: The values to set keyed with (metric, labels)
+            without updating the epoch
+        """
+
+        if not deltas and not observations and not values:
+            return
+        with self._lock:
+            if deltas:
+                for (metric, labels), inc_by in deltas.items():
+                    self._get_entry_unlocked(metric).inc_unlocked(labels, inc_by)
+                self._epoch += 1
+            if observations:
+                for metric, labels, value in observations:
+                    self._get_entry_unlocked(metric).observe_unlocked(labels, value)
+            if values:
+                for (metric, labels), value in values.items():
+                    self._get_entry_unlocked(metric).set_unlocked(labels, value)
+
     def move(self, metrics, src_labels, dst_labels):
         if not isinstance(metrics, (list, tuple)):
             metrics = [metrics]
@@ -294,7 +714,9 @@ class MetricsCollection:
             self.metrics[metric].move(src_labels, dst_labels)
 
     def get_buf(self):
-        buf = ""
+        # Only copy the values holding the lock as rendering them takes
+        # much longer and the lock is blocking the updates of the metrics
         with self._lock:
-            buf = "".join(map(str, self.metrics.values()))
-        return buf
+            entries = [(me, me.snapshot()) for me in self.metrics.values()]
+            label_values = self.labels.get_values()
+        return "".join(me.render(snapshot, label_values) for me, snapshot in entries)
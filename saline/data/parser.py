@@ -1,10 +1,15 @@
 import re
 
+from collections import deque
+from datetime import datetime
 from dateutil.parser import parse as datetime_parse, ParserError
 from time import time
 
 from salt.utils.args import parse_input as parse_input_args
 
+from saline.data.cache import LRUCache
+from saline.data.filter import get_literal_prefix
+
 
 class EventTags:
     # salt/job/*...
@@ -176,31 +181,189 @@ __TAG_PATTERNS = (
 __STATE_TAGS_DIV = "_|-"
 
 
-def get_tag_mask(tag, return_all=False, return_minion_id=False):
-    tag_minion_id = None
-    for pattern, repl, tag_main, tag_sub, tag_minion_group in __TAG_PATTERNS:
+def __is_prefix_compatible(pattern, key):
+    """
+    Check if the pattern could match the tag starting with the key segments
+    """
+
+    if pattern.pattern.startswith("\\d") and not key[0][:1].isdigit():
+        return False
+    prefix = get_literal_prefix(pattern.pattern).split("/")
+    for i, segment in enumerate(key):
+        if i >= len(prefix):
+            break
+        if i == len(prefix) - 1:
+            # The last segment of the prefix could be incomplete
+            return segment.startswith(prefix[i])
+        if segment != prefix[i]:
+            return False
+    return True
+
+
+def __get_tag_dispatch():
+    """
+    Get the patterns which could match the tags by the leading tag segments
+    """
+
+    keys = set()
+    for p in __TAG_PATTERNS:
+        prefix = get_literal_prefix(p[0].pattern).split("/")
+        if len(prefix) > 1 and prefix[1]:
+            keys.add(tuple(prefix[:2]))
+    return {
+        key: tuple(p for p in __TAG_PATTERNS if __is_prefix_compatible(p[0], key))
+        for key in keys
+    }
+
+
+__TAG_DISPATCH = __get_tag_dispatch()
+
+# The tag segments containing jid to normalize the tags for caching
+__TAG_JID_SEGMENTS = ("job", "batch", "run", "wheel")
+# The tag segments containing minion id to normalize the tags for caching
+__TAG_MINION_SEGMENTS = ("minion", "beacon")
+
+__TAG_JOB_PREFIX = "salt/job/"
+__TAG_JOB_RET_PATTERN = __TAG_PATTERNS[0][0]
+__TAG_JOB_RET_MASKS = __TAG_PATTERNS[0][1:4]
+# The job return pattern is matched before the dispatch, so skip it there
+__TAG_JOB_PATTERNS = tuple(
+    p for p in __TAG_DISPATCH[("salt", "job")] if p[0] is not __TAG_JOB_RET_PATTERN
+)
+
+__TAG_MASKS_CACHE = LRUCache(8192)
+
+
+def __match_tag(tag, patterns=None):
+    if patterns is None:
+        patterns = __TAG_DISPATCH.get(tuple(tag.split("/", 2)[:2]), __TAG_PATTERNS)
+    for pattern, repl, tag_main, tag_sub, tag_minion_group in patterns:
         match = pattern.match(tag)
         if match:
+            tag_mask = repl
             if callable(repl):
-                tag = repl(match)
-                if isinstance(tag, tuple):
-                    if len(tag) == 3:
-                        tag, tag_main, tag_sub = tag
+                tag_mask = repl(match)
+                if isinstance(tag_mask, tuple):
+                    if len(tag_mask) == 3:
+                        tag_mask, tag_main, tag_sub = tag_mask
                     else:
-                        tag, tag_sub = tag
-            else:
-                tag = repl
+                        tag_mask, tag_sub = tag_mask
+            tag_minion_id = None
             if tag_minion_group is not None:
                 tag_minion_id = match.group(tag_minion_group)
-            break
+            return tag_mask, tag_main, tag_sub, tag_minion_id
+    # The tags not matching any pattern are getting the values
+    # of the last pattern not requiring the function in the event
+    return None, __TAG_PATTERNS[-1][2], __TAG_PATTERNS[-1][3], None
+
+
+def __get_tag_cache_key(tag):
+    """
+    Replace the jid or the minion id in the tag to get the same cache key
+    for different jobs and minions, returns the key with the minion id replaced
+    """
+
+    if tag.isdigit():
+        return "0", None
+    segments = tag.split("/", 3)
+    if len(segments) > 3 and segments[0] == "salt":
+        if segments[1] in __TAG_JID_SEGMENTS and segments[2].isdigit():
+            return "salt/%s/0/%s" % (segments[1], segments[3]), None
+        if segments[1] in __TAG_MINION_SEGMENTS:
+            # salt/minion/<minion_id>/start, salt/beacon/<minion_id>/...
+            return "salt/%s/0/%s" % (segments[1], segments[3]), segments[2]
+    elif len(segments) == 3 and segments[0] == "minion" and segments[1] == "refresh":
+        return "minion/refresh/0", segments[2]
+    return tag, None
+
+
+def get_tag_mask(tag, return_all=False, return_minion_id=False):
+    if tag.startswith(__TAG_JOB_PREFIX):
+        match = __TAG_JOB_RET_PATTERN.match(tag)
+        if match is not None:
+            # The job returns are the most common events,
+            # so they are checked first with the shortest path
+            if return_all:
+                if return_minion_id:
+                    return (*__TAG_JOB_RET_MASKS, match.group(1))
+                return __TAG_JOB_RET_MASKS
+            if return_minion_id:
+                return __TAG_JOB_RET_MASKS[0], match.group(1)
+            return __TAG_JOB_RET_MASKS[0]
+        # The other job tags are matched with the patterns of the dispatch,
+        # it's cheaper than caching them per jid and minion
+        matched = __match_tag(tag, __TAG_JOB_PATTERNS)
+    else:
+        key, minion_id = __get_tag_cache_key(tag)
+        matched = __TAG_MASKS_CACHE.get(key)
+        if matched is None:
+            matched = __match_tag(key)
+            __TAG_MASKS_CACHE.set(key, matched)
+        if minion_id is not None and matched[3] is not None:
+            # The cached result contains the minion id of the key
+            matched = (*matched[:3], minion_id)
+    tag_mask, tag_main, tag_sub, tag_minion_id = matched
+    if tag_mask is None:
+        tag_mask = tag
     if return_all:
         if return_minion_id:
-            return tag, tag_main, tag_sub, tag_minion_id
-        return tag, tag_main, tag_sub
+            return tag_mask, tag_main, tag_sub, tag_minion_id
+        return tag_mask, tag_main, tag_sub
     else:
         if return_minion_id:
-            return tag, tag_minion_id
-        return tag
+            return tag_mask, tag_minion_id
+        return tag_mask
+
+
+def get_tag_masks_cache():
+    return __TAG_MASKS_CACHE
+
+
+def get_shard_key(tag, data=None):
+    """
+    Get the key to pass the events related to the same jid or minion
+    to the same events reader
+
+    The job returns are keyed by the minion id, so the returns of the job
+    targeting many minions are spread across the readers.
+    """
+
+    segments = tag.split("/", 4)
+    if len(segments) == 5 and segments[:2] == ["salt", "job"] and segments[3] == "ret":
+        # salt/job/<jid>/ret/<minion_id>
+        return segments[4]
+    if len(segments) > 2 and segments[0] in ("salt", "minion"):
+        # salt/job/<jid>/..., salt/batch/<jid>/..., salt/run/<jid>/...,
+        # salt/minion/<minion_id>/start, minion/refresh/<minion_id> etc.
+        return segments[2]
+    if isinstance(data, dict) and isinstance(data.get("id"), str):
+        return data["id"]
+    return tag
+
+
+__EPOCH = datetime(1970, 1, 1)
+
+# The format of the timestamps generated by Salt with datetime.isoformat
+__ISO_FORMATS = ("%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S")
+
+
+def __strptime_iso(ts):
+    """
+    Parse the naive ISO 8601 timestamp on Python 3.6
+    without datetime.fromisoformat
+    """
+
+    if not isinstance(ts, str):
+        raise TypeError("The timestamp is not a string: %r" % (ts,))
+    for fmt in __ISO_FORMATS:
+        try:
+            return datetime.strptime(ts, fmt)
+        except ValueError:
+            pass
+    raise ValueError("Unable to parse the timestamp: %s" % ts)
+
+
+__fromisoformat = getattr(datetime, "fromisoformat", __strptime_iso)
 
 
 def get_timestamp(ts):
@@ -209,29 +372,89 @@ def get_timestamp(ts):
     """
 
     try:
-        ts = datetime_parse("%sZ" % ts).timestamp()
-    except ParserError:
-        # Return current time if not possible to parse the timestamp
-        ts = time()
-    return ts
+        # Salt timestamps are always in ISO 8601 format in UTC
+        dt = __fromisoformat(ts)
+    except (TypeError, ValueError):
+        try:
+            return datetime_parse("%sZ" % ts).timestamp()
+        except ParserError:
+            # Return current time if not possible to parse the timestamp
+            return time()
+    if dt.tzinfo is None:
+        return (dt - __EPOCH).total_seconds()
+    return dt.timestamp()
 
 
-def get_trimmed(data):
+def get_jid_timestamp(jid, utc=False):
+    """
+    Get unix timestamp from Salt job ID,
+    returns None if the job ID is not generated from the time
+    """
+
+    jid = str(jid)
+    if len(jid) > 20 and jid[20] == "_":
+        # The job ID could be suffixed with the PID with unique_jid enabled
+        jid = jid[:20]
+    if len(jid) != 20 or not jid.isdigit():
+        return None
+    try:
+        dt = __fromisoformat(
+            "%s-%s-%sT%s:%s:%s.%s"
+            % (
+                jid[0:4],
+                jid[4:6],
+                jid[6:8],
+                jid[8:10],
+                jid[10:12],
+                jid[12:14],
+                jid[14:],
+            )
+        )
+    except ValueError:
+        return None
+    if utc:
+        return (dt - __EPOCH).total_seconds()
+    # The job IDs are generated in the local time of the master by default
+    return dt.timestamp()
+
+
+def __format_trimmed_path(path):
+    keys = []
+    while path is not None:
+        path, key = path
+        keys.append(key)
+    return "".join(
+        "[%s]" % key if isinstance(key, int) else '["%s"]' % key.replace('"', '\\"')
+        for key in reversed(keys)
+    )
+
+
+def get_trimmed(data, max_depth=32, max_paths=1000):
     """
     Generator returning the trimmed value pathes from Salt data
+
+    :param int max_depth: The maximum depth of the data to look for the trimmed values
+    :param int max_paths: The maximum number of the trimmed value pathes to return
     """
 
-    l = [(data, "")]
-    while l:
-        i, p = l.pop(0)
+    # The pathes are kept as linked (parent, key) pairs
+    # and formatted only for the trimmed values
+    q = deque(((data, None, 0),))
+    while q and max_paths > 0:
+        i, p, d = q.popleft()
+        if isinstance(i, str):
+            if i == "VALUE_TRIMMED":
+                max_paths -= 1
+                yield __format_trimmed_path(p)
+            continue
+        if d >= max_depth:
+            continue
         if isinstance(i, dict):
             for k, v in i.items():
-                l.append((v, '%s["%s"]' % (p, k.replace('"', '\\"'))))
+                q.append((v, (p, str(k)), d + 1))
         elif isinstance(i, (list, tuple)):
             for k, v in enumerate(i):
-                l.append((v, "%s[%s]" % (p, k)))
-        elif isinstance(i, str) and i == "VALUE_TRIMMED":
-            yield p
+                q.append((v, (p, k), d + 1))
 
 
 def split_state_tags(tags, name=None):
@@ -266,15 +489,28 @@ def parse_duration(dur):
     return None
 
 
-def parse_state_fun_args(fun_args):
+def __get_fun_args_key(value):
+    """
+    Get the hashable representation of the function arguments,
+    the types are included to not mix up the values like True and 1
+    """
+
+    if isinstance(value, dict):
+        return (dict, tuple((k, __get_fun_args_key(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (list, tuple(__get_fun_args_key(v) for v in value))
+    return (value.__class__, value)
+
+
+def __parse_state_fun_args(fun_args):
     args = []
     kwargs = {}
 
     for arg in fun_args:
         if isinstance(arg, dict):
-            arg.pop("__kwarg__", None)
             for key, val in arg.items():
-                kwargs[key] = val
+                if key != "__kwarg__":
+                    kwargs[key] = val
         else:
             pkwargs = parse_input_args([arg], condition=False)[1]
             if pkwargs:
@@ -293,3 +529,29 @@ def parse_state_fun_args(fun_args):
     )
 
     return args, kwargs
+
+
+__STATE_FUN_ARGS_CACHE = LRUCache(1024)
+
+
+def parse_state_fun_args(fun_args):
+    """
+    Get the positional and keyword arguments of the state function,
+    the result is shared between the calls with the same arguments
+    and must not be modified
+    """
+
+    try:
+        key = __get_fun_args_key(fun_args)
+        parsed = __STATE_FUN_ARGS_CACHE.get(key)
+    except TypeError:
+        # The arguments containing unhashable values are not cached
+        return __parse_state_fun_args(fun_args)
+    if parsed is None:
+        parsed = __parse_state_fun_args(fun_args)
+        __STATE_FUN_ARGS_CACHE.set(key, parsed)
+    return parsed
+
+
+def get_state_fun_args_cache():
+    return __STATE_FUN_ARGS_CACHE
@@ -0,0 +1,80 @@
+import logging
+import re
+
+from saline.data.cache import LRUCache
+
+
+log = logging.getLogger(__name__)
+
+
+# The numbered backreferences are shifted in the combined regex
+_NUMBERED_BACKREF = re.compile(r"\\[1-9]|\(\?P=\d")
+
+_MISSING = object()
+
+
+class RenameRules:
+    """
+    Compiled rename rules replacing the value with the one of the first rule
+    matching it
+    """
+
+    def __init__(self, rules, cache_size=4096):
+        """
+        Create a Rename Rules object instance
+
+        :param dict rules: The regex patterns with the replacements in the order
+            of applying
+        :param int cache_size: The size of LRU cache for the recent rename results
+        """
+
+        self._rules = tuple((re.compile(k), v) for k, v in rules.items())
+        self._combined = None
+        self._replacements = {}
+        self._cache = LRUCache(cache_size)
+
+        if len(self._rules) > 1:
+            self._combine(rules)
+
+    def __len__(self):
+        return len(self._rules)
+
+    def _combine(self, rules):
+        patterns = []
+        for i, (pattern, replacement) in enumerate(rules.items()):
+            if _NUMBERED_BACKREF.search(pattern):
+                log.debug("Unable to combine the rename rule: %s", pattern)
+                return
+            name = "_rule%d" % i
+            patterns.append("(?P<%s>%s)" % (name, pattern))
+            self._replacements[name] = replacement
+        try:
+            # The alternatives are tried in order, so the first rule matching wins
+            self._combined = re.compile("|".join(patterns))
+        except re.error:
+            log.debug("Unable to combine the rename rules: %s", list(rules))
+            self._replacements = {}
+
+    def _rename(self, value):
+        if self._combined is not None:
+            match = self._combined.match(value)
+            if match is None:
+                return None
+            return self._replacements[match.lastgroup]
+        for pattern, replacement in self._rules:
+            if pattern.match(value):
+                return replacement
+        return None
+
+    def rename(self, value):
+        """
+        Get the replacement of the value, returns None if no rule matches it
+        """
+
+        if not self._rules:
+            return None
+        renamed = self._cache.get(value, _MISSING)
+        if renamed is _MISSING:
+            renamed = self._rename(value)
+            self._cache.set(value, renamed)
+        return renamed
@@ -14,6 +14,8 @@ class SmartMerger:
         match_quality=0.3,
         match_len_trashold=3,
         data=None,
+        merge_pending_callback=None,
+        merge_pending_callback_opts=(),
     ):
         self._data = [] if data is None else data
         self._rules = []
@@ -27,6 +29,11 @@ class SmartMerger:
         self._merge_callback = merge_callback
         self._merge_callback_opts = merge_callback_opts
         self._in_merge = False
+        # Only mark the values as pending merging on adding them
+        # if the values are merged by the separate merging pass
+        self._merge_pending_callback = merge_pending_callback
+        self._merge_pending_callback_opts = merge_pending_callback_opts
+        self.merge_pending = False
 
     def add(self, key, value=None):
         if key not in self._data:
@@ -35,7 +42,16 @@ class SmartMerger:
             else:
                 self._data.append(value)
             if len(self._data) > self._start_merging_on and not self._in_merge:
-                self.merge_values()
+                if self._merge_pending_callback is None:
+                    self.merge_values()
+                elif not self.merge_pending:
+                    self.merge_pending = True
+                    self._merge_pending_callback(
+                        self, *self._merge_pending_callback_opts
+                    )
+
+    def get_items(self):
+        return list(self._data.keys() if isinstance(self._data, dict) else self._data)
 
     def get(self, value):
         value = str(value)
@@ -69,15 +85,14 @@ class SmartMerger:
                 ret.append("")
         return tuple(ret)
 
-    def merge_values(self):
+    def merge_values(self, found=None):
         if self._in_merge:
             return
         try:
             self._in_merge = True
-            new_rules = self.get_new_rules()
-            orig_items = list(
-                self._data.keys() if isinstance(self._data, dict) else self._data
-            )
+            self.merge_pending = False
+            new_rules = self.get_new_rules(found)
+            orig_items = self.get_items()
             if not isinstance(new_rules, list):
                 return
             if callable(self._new_rules_callback):
@@ -99,63 +114,151 @@ class SmartMerger:
         finally:
             self._in_merge = False
 
-    def get_new_rules(self):
+    def _get_qgrams(self, value):
+        q = max(self._match_len_trashold, 1)
+        qgrams = {}
+        for i in range(len(value) - q + 1):
+            qgram = value[i : i + q]
+            qgrams[qgram] = qgrams.get(qgram, 0) + 1
+        return qgrams
+
+    def _get_candidates(self, items):
+        """
+        Get the pairs of the items which could match with the required quality
+
+        Each matching block is at least ``match_len_trashold`` (``q``) long
+        and the block of size ``s`` contains ``s - q + 1 >= s / q`` q-grams
+        common for both items, so the matching items have to share at least
+        ``quality * max_len / q`` q-grams counted with the repetitions.
+        The matched length could not exceed the length of the shorter item
+        as well, so the lengths of the matching items could not differ too much.
+        These are only the necessary conditions, so all of the matching pairs
+        are in the candidates, the pairs which could not match are skipped.
+        """
+
+        q = max(self._match_len_trashold, 1)
+        qgrams = [self._get_qgrams(item) for item in items]
+        index = {}
+        for j, item_qgrams in enumerate(qgrams):
+            for qgram, count in item_qgrams.items():
+                index.setdefault(qgram, []).append((j, count))
+        candidates = {}
+        for i, item_qgrams in enumerate(qgrams):
+            shared = {}
+            for qgram, count in item_qgrams.items():
+                for j, j_count in index[qgram]:
+                    shared[j] = shared.get(j, 0) + min(count, j_count)
+            la = len(items[i])
+            for j, count in shared.items():
+                if j == i:
+                    continue
+                max_len = max(la, len(items[j]))
+                if min(la, len(items[j])) < self._match_quality * max_len:
+                    continue
+                if count * q < self._match_quality * max_len:
+                    continue
+                candidates.setdefault(j, []).append(i)
+        return candidates
+
+    def _match_parts(self, parts, pattern, value):
+        # The same as matching the pattern joining the parts with ".*"
+        # as long as there is no new line in the value
+        if "\n" in value:
+            return pattern.match(value) is not None
+        if not value.startswith(parts[0]):
+            return False
+        pos = len(parts[0])
+        for part in parts[1:]:
+            pos = value.find(part, pos)
+            if pos == -1:
+                return False
+            pos += len(part)
+        return True
+
+    def find_matches(self, items=None):
+        """
+        Find the common parts of the values to discover the merging rules from,
+        the state of the merger is not changed, so it could be called for
+        the copy of the values without holding the lock of the data
+
+        :param list items: The values to find the matches of, all of the values
+            of the merger if not specified
+
+        :return: The number of the values, the matches with their counts and
+            qualities, the compiled patterns and the counts of the matched values
+        """
+
         matches = {}
-        ret_rules = []
         seq_matcher = SequenceMatcher(None, None, None, False)
-        items = list(self._data.keys() if isinstance(self._data, dict) else self._data)
+        items = self.get_items() if items is None else list(items)
         items.sort(key=lambda x: len(x), reverse=True)
         items_count = len(items)
-        for i in range(items_count - 1):
-            a = items[i]
-            if a in self._replacements:
+        replacements = set(self._replacements)
+        # Compare only the pairs of the items which could match,
+        # the second item of the pair is set once for all of its pairs
+        # as SequenceMatcher caches the details about the second sequence
+        pairs = {}
+        for j, candidates in self._get_candidates(items).items():
+            b = items[j]
+            if b in replacements:
                 continue
-            la = len(a)
-            seq_matcher.set_seq1(a)
-            for j in range(items_count):
-                if j == i:
+            lb = len(b)
+            seq_matcher.set_seq2(b)
+            for i in candidates:
+                a = items[i]
+                if i == items_count - 1 or a in replacements:
                     continue
-                b = items[j]
-                if b in self._replacements:
-                    continue
-                lb = len(b)
-                seq_matcher.set_seq2(b)
+                la = len(a)
+                seq_matcher.set_seq1(a)
                 match = self.get_matches(a, b, seq_matcher.get_matching_blocks())
                 if match:
                     lm = len("".join(match))
                     mq = lm / max(la, lb)
                     if mq < self._match_quality:
                         continue
-                    if match not in matches:
-                        matches[match] = [1, mq]
-                    else:
-                        matches[match][0] += 1
-                        matches[match][1] += mq
+                    pairs[(i, j)] = (match, mq)
+        # Count the matches in the same order as comparing all of the pairs
+        for _, (match, mq) in sorted(pairs.items()):
+            if match not in matches:
+                matches[match] = [1, mq]
+            else:
+                matches[match][0] += 1
+                matches[match][1] += mq
         mk = list(matches.keys())
         crexp = {k: re.compile(".*".join(map(lambda x: re.escape(x), k))) for k in mk}
         merged_counts = {}
         for k in mk:
+            pattern = crexp[k]
             merged_counts[k] = sum(
-                map(
-                    lambda x: crexp[k].match(x) is not None,
-                    self._data.keys() if isinstance(self._data, dict) else self._data,
-                )
+                self._match_parts(k, pattern, x) for x in items
             )
+        return items_count, matches, crexp, merged_counts
+
+    def get_new_rules(self, found=None):
+        if found is None:
+            found = self.find_matches()
+        items_count, matches, crexp, merged_counts = found
+        ret_rules = []
+        mk = list(matches.keys())
         mk.sort(
             key=lambda k: matches[k][0] * matches[k][1] * merged_counts[k], reverse=True
         )
+        replacements = set(self._replacements)
+        patterns = set(self._patterns)
         full_merged_count = 0
         for k in mk:
             pattern = crexp[k]
             merged_count = merged_counts[k]
             replacement = "*".join(k)
-            if replacement in self._replacements:
+            if replacement in replacements:
                 continue
-            if pattern in self._patterns:
+            if pattern in patterns:
                 continue
             rs = (pattern, replacement)
             self._patterns.append(pattern)
             self._replacements.append(replacement)
+            patterns.add(pattern)
+            replacements.add(replacement)
             self._rules.append(rs)
             ret_rules.append(rs)
             full_merged_count += merged_count
@@ -165,62 +268,3 @@ class SmartMerger:
             ):
                 return ret_rules
         return ret_rules if ret_rules else None
-
-
-class MergeWrapper:
-    def __init__(
-        self,
-        data,
-        start_merging_on,
-        new_rules_callback=None,
-        new_rules_callback_opts=(),
-        merge_callback=None,
-        merge_callback_opts=(),
-        match_quality=0.7,
-        match_len_trashold=3,
-    ):
-        self._data = data
-        self._sm = SmartMerger(
-            start_merging_on,
-            new_rules_callback=new_rules_callback,
-            new_rules_callback_opts=new_rules_callback_opts,
-            merge_callback=merge_callback,
-            merge_callback_opts=merge_callback_opts,
-            match_quality=match_quality,
-            match_len_trashold=match_len_trashold,
-            data=self._data,
-        )
-
-    def __repr__(self):
-        return f"<MergeWrapper: {self._data}>"
-
-    def __dir__(self):
-        self_attrs = super().__dir__()
-        data_attrs = self._data.__dir__()
-        return list(set([*self_attrs, *data_attrs]))
-
-    def __getattr__(self, key):
-        return getattr(self._data, key)
-
-    def __iter__(self):
-        return self._data.__iter__()
-
-    def __getitem__(self, key):
-        return self._data[key]
-
-    def __setitem__(self, key, value):
-        if isinstance(self._data, dict):
-            if key not in self._data:
-                self._sm.add(key, value)
-        else:
-            if value not in self._data:
-                self._sm.add(value)
-        self._data[key] = value
-
-    def append(self, value):
-        if value not in self._data:
-            self._sm.add(value)
-        self._data.append(value)
-
-    def get_wrapped(self, value):
-        return self._sm.get(value)
@@ -1,7 +1,9 @@
 import logging
 
 from threading import Lock
-from time import time
+from time import monotonic, time
+
+from saline.data.smart import SmartMerger
 
 
 log = logging.getLogger(__name__)
@@ -260,3 +262,208 @@ class StateJobCollection:
             state_job = self._state_jobs.get(state_fun_args, None)
             if state_job is not None:
                 state_job.complete_with_timeout(timeout=timeout, ts=ts, before=before)
+
+
+class StateResultsRegistry:
+    """
+    Flat registry of the sls, sid, fun and status labels of the state results
+    merging the similar sls and sid values with the smart mergers
+    """
+
+    def __init__(
+        self,
+        sls_merging_on=70,
+        sid_merging_on=150,
+        new_rules_callback=None,
+        move_callback=None,
+        cache_size=65536,
+        merge_deferred=False,
+    ):
+        """
+        Create the registry
+
+        :param int sls_merging_on: The number of sls values to start merging on
+        :param int sid_merging_on: The number of sid values per sls to start merging on
+        :param callable new_rules_callback: The function to call with the new
+            merging rules and the kind of the values (``sls`` or ``sid``)
+        :param callable move_callback: The function to call with the source
+            and the destination labels on merging
+        :param int cache_size: The maximum number of the labels to keep mapped
+            to the merged ones, the cache is cleared on reaching it
+        :param bool merge_deferred: Only track the values to merge on adding them
+            and merge them with ``merge_pending`` instead
+        """
+
+        self._sid_merging_on = sid_merging_on
+        self._new_rules_callback = new_rules_callback
+        self._move_callback = move_callback
+        self._cache_size = cache_size
+        self._merge_deferred = merge_deferred
+        # The smart mergers pending merging with the sls of the sid mergers
+        self._pending = {}
+        # The sids with the set of their funs by sls, which is also
+        # the reverse index of the sids of each sls
+        self._sids = {}
+        # The sets of the statuses by (sls, sid, fun)
+        self._statuses = {}
+        self._sls_merger = SmartMerger(
+            sls_merging_on,
+            new_rules_callback=new_rules_callback,
+            new_rules_callback_opts=("sls",),
+            merge_callback=self._merge_sls,
+            match_quality=0.7,
+            data=self._sids,
+            merge_pending_callback=self._add_pending if merge_deferred else None,
+        )
+        self._sid_mergers = {}
+        # The labels mapped to the merged ones
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._statuses)
+
+    def __contains__(self, labels):
+        sls, sid, fun, status = labels
+        return status in self._statuses.get((sls, sid, fun), ())
+
+    def _get_sid_merger(self, sls):
+        sid_merger = self._sid_mergers.get(sls)
+        if sid_merger is None:
+            sid_merger = SmartMerger(
+                self._sid_merging_on,
+                new_rules_callback=self._new_rules_callback,
+                new_rules_callback_opts=("sid",),
+                merge_callback=self._merge_sid,
+                merge_callback_opts=(sls,),
+                match_quality=0.7,
+                data=self._sids[sls],
+                merge_pending_callback=self._add_pending
+                if self._merge_deferred
+                else None,
+                merge_pending_callback_opts=(sls,),
+            )
+            self._sid_mergers[sls] = sid_merger
+        return sid_merger
+
+    def _add_pending(self, smart_merger, sls=None):
+        self._pending[smart_merger] = sls
+
+    def _pop_pending(self):
+        while self._pending:
+            smart_merger = next(iter(self._pending))
+            sls = self._pending.pop(smart_merger)
+            # The sid merger is dropped on merging its sls
+            if sls is None or self._sid_mergers.get(sls) is smart_merger:
+                return smart_merger
+        return None
+
+    def merge_pending(self, lock, budget=None):
+        """
+        Merge the values of the smart mergers pending merging
+
+        The matches of the values are found on the copy of them without holding
+        the lock, so adding the values is blocked only by applying the rules
+
+        :param lock: The lock to hold while changing the registry
+        :param float budget: The seconds to stop starting the merges after,
+            all of the pending smart mergers are merged if not specified
+
+        :return: The number of the smart mergers still pending merging
+        """
+
+        started = monotonic()
+        while budget is None or monotonic() - started < budget:
+            with lock:
+                smart_merger = self._pop_pending()
+                if smart_merger is None:
+                    break
+                items = smart_merger.get_items()
+            found = smart_merger.find_matches(items)
+            with lock:
+                smart_merger.merge_values(found)
+        with lock:
+            return len(self._pending)
+
+    def _add_sls(self, sls):
+        self._sls_merger.add(sls, {})
+        # The sls could be merged on adding it
+        sls = self._sls_merger.get(sls)
+        if sls not in self._sids:
+            self._sids[sls] = {}
+        return sls
+
+    def _add_sid(self, sls, sid):
+        sid_merger = self._get_sid_merger(sls)
+        sid_merger.add(sid, set())
+        # The sid could be merged on adding it
+        sid = sid_merger.get(sid)
+        sids = self._sids[sls]
+        if sid not in sids:
+            sids[sid] = set()
+        return sid
+
+    def get(self, labels):
+        """
+        Register the state result labels and get the merged ones
+
+        :param tuple labels: The sls, sid, fun and status of the state result
+        """
+
+        merged = self._cache.get(labels)
+        if merged is not None:
+            return merged
+        sls, sid, fun, status = labels
+        (sls, sid, fun) = (str(sls), str(sid), str(fun))
+        sls = self._sls_merger.get(sls)
+        if sls not in self._sids:
+            sls = self._add_sls(sls)
+        sid = self._get_sid_merger(sls).get(sid)
+        if sid not in self._sids[sls]:
+            sid = self._add_sid(sls, sid)
+        self._sids[sls][sid].add(fun)
+        key = (sls, sid, fun)
+        statuses = self._statuses.get(key)
+        if statuses is None:
+            statuses = set()
+            self._statuses[key] = statuses
+        statuses.add(status)
+        merged = (sls, sid, fun, status)
+        if len(self._cache) >= self._cache_size:
+            self._cache.clear()
+        self._cache[labels] = merged
+        return merged
+
+    def _merge_sls(self, src_sls, dst_sls):
+        self._cache.clear()
+        for sid in list(self._sids.get(src_sls, ())):
+            self._merge_sid(sid, sid, src_sls, dst_sls)
+        self._sids.pop(src_sls, None)
+        self._sid_mergers.pop(src_sls, None)
+        return True
+
+    def _merge_sid(self, src_sid, dst_sid, src_sls, dst_sls=None):
+        self._cache.clear()
+        if dst_sls is None:
+            dst_sls = src_sls
+        elif dst_sls not in self._sids:
+            self._sls_merger.add(dst_sls, {})
+            self._sids.setdefault(dst_sls, {})
+        if dst_sid not in self._sids[dst_sls]:
+            self._get_sid_merger(dst_sls).add(dst_sid, set())
+            self._sids[dst_sls].setdefault(dst_sid, set())
+        dst_funs = self._sids[dst_sls][dst_sid]
+        for fun in self._sids[src_sls].get(src_sid, ()):
+            statuses = self._statuses.pop((src_sls, src_sid, fun), set())
+            if callable(self._move_callback):
+                for status in statuses:
+                    self._move_callback(
+                        (src_sls, src_sid, fun, status), (dst_sls, dst_sid, fun, status)
+                    )
+            dst_funs.add(fun)
+            dst_statuses = self._statuses.get((dst_sls, dst_sid, fun))
+            if dst_statuses is None:
+                self._statuses[(dst_sls, dst_sid, fun)] = statuses
+            else:
+                dst_statuses.update(statuses)
+        self._sids[src_sls].pop(src_sid, None)
+        return True
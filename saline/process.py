@@ -3,28 +3,45 @@ import cherrypy
 import contextlib
 import logging
 import os
-import re
 import signal
 import sys
 import traceback
 
 import salt.ext.tornado.gen
+import salt.payload
 import salt.transport.ipc
-import salt.syspaths
 import salt.utils.files
+import salt.utils.stringutils
 
 from cherrypy.process.wspbus import ChannelFailures
-from multiprocessing import Pipe, Queue
+from multiprocessing import Array, Pipe, Queue
 from threading import Thread, Lock
-from time import time, sleep
+from time import monotonic, time, sleep
 from queue import Empty as QueueEmpty
 
 from saline import restapi
+from saline.buffer import (
+    EventsBuffer,
+    LoadShedder,
+    QueueBatcher,
+    ShardedBatcher,
+    unbatch,
+)
+from saline.capture import EventsCaptureWriter
 from saline.data.event import EventParser
-from saline.data.merger import DataMerger
+from saline.data.filter import TagFilter
+from saline.data.merger import DataMerger, EventsAggregator
+from saline.data.parser import (
+    get_shard_key,
+    get_state_fun_args_cache,
+    get_tag_masks_cache,
+)
+from saline.source import get_events_source
+from saline.data.metrics import Metrics
 
+from salt.exceptions import SaltConfigurationError
 from salt.ext.tornado.ioloop import IOLoop, PeriodicCallback
-from salt.utils.event import get_event
+from salt.utils.event import SaltEvent, TAGEND
 from salt.utils.process import (
     ProcessManager,
     SignalHandlingProcess,
@@ -49,8 +66,60 @@ class Saline(SignalHandlingProcess):
         super().__init__()
 
         self.opts = opts
-        self.req_queue = Queue()
-        self.ret_queue = Queue()
+        self.req_queue = self._create_queue()
+        self.ret_queue = self._create_queue()
+        self.req_queues = [self.req_queue]
+        if self.opts.get("events_sharding", False):
+            self.req_queues = [
+                self._create_queue()
+                for _ in range(int(self.opts["readers_subprocesses"]) - 1)
+            ]
+            self.req_queues.insert(0, self.req_queue)
+
+        self._autoscale = self.opts.get("readers_autoscale", False)
+        if self._autoscale and len(self.req_queues) > 1:
+            log.warning(
+                "Events readers autoscaling is not supported with events sharding"
+            )
+            self._autoscale = False
+        self._readers_min = max(int(self.opts.get("readers_min", 1)), 1)
+        self._readers_max = max(
+            int(self.opts.get("readers_max", 10)), self._readers_min
+        )
+        self._readers = {}
+        # The retired readers by index which could still be finishing the batch
+        self._readers_retired = {}
+        self._readers_stop = None
+        self._readers_scaled = {"up": 0, "down": 0}
+        self._readers_low_since = None
+        self._batch_size = max(self.opts.get("events_batch_size", 1), 1)
+        if self._autoscale:
+            self._readers_stop = Array("b", self._readers_max)
+
+    def _create_queue(self):
+        """
+        Create the queue to pass the events between the processes
+        with the transport specified in the config
+        """
+
+        if self.opts.get("transport", "queue") == "shm":
+            # Imported on demand as multiprocessing.shared_memory
+            # is not available before Python 3.8
+            try:
+                from saline.shm import SharedMemoryQueue
+            except ImportError as exc:
+                raise SaltConfigurationError(
+                    "The 'shm' transport requires Python 3.8 or newer, "
+                    "use 'transport: queue' instead: %s" % exc
+                )
+            return SharedMemoryQueue(self.opts.get("transport_shm_size", 67108864))
+        return Queue()
+
+    def _close_queues(self):
+        if self.opts.get("transport", "queue") != "shm":
+            return
+        for queue in (*self.req_queues, self.ret_queue):
+            queue.close()
 
     def start(self):
         """
@@ -65,7 +134,8 @@ class Saline(SignalHandlingProcess):
                 EventsManager,
                 args=(
                     self.opts,
-                    self.req_queue,
+                    self.req_queues,
+                    self.ret_queue,
                 ),
             )
             self.process_manager.add_process(
@@ -75,16 +145,13 @@ class Saline(SignalHandlingProcess):
                     self.ret_queue,
                 ),
             )
-            for i in range(int(self.opts["readers_subprocesses"])):
-                self.process_manager.add_process(
-                    EventsReader,
-                    args=(
-                        self.opts,
-                        self.req_queue,
-                        self.ret_queue,
-                        i,
-                    ),
+            readers_count = int(self.opts["readers_subprocesses"])
+            if self._autoscale:
+                readers_count = min(
+                    max(readers_count, self._readers_min), self._readers_max
                 )
+            for i in range(readers_count):
+                self._start_reader(i)
             self.process_manager.add_process(
                 CherryPySrv,
                 args=(self.opts,),
@@ -99,12 +166,143 @@ class Saline(SignalHandlingProcess):
             # No custom signal handling was added, install our own
             signal.signal(signal.SIGTERM, self._handle_signals)
 
-        self.process_manager.run()
+        if self._autoscale:
+            io_loop = IOLoop()
+            autoscale_cb = PeriodicCallback(
+                self.autoscale_readers,
+                self.opts.get("readers_autoscale_interval", 5) * 1000,
+                io_loop=io_loop,
+            )
+            autoscale_cb.start()
+            # Run the process manager in the same IO loop with autoscaling
+            # to prevent modifying the processes map concurrently
+            io_loop.run_sync(lambda: self.process_manager.run(asynchronous=True))
+        else:
+            self.process_manager.run()
+
+    def _start_reader(self, idx):
+        if self._readers_stop is not None:
+            self._readers_stop[idx] = 0
+        self._readers[idx] = self.process_manager.add_process(
+            EventsReader,
+            args=(
+                self.opts,
+                self.req_queues[idx % len(self.req_queues)],
+                self.ret_queue,
+                idx,
+            ),
+            kwargs={"stop_flags": self._readers_stop},
+        )
+
+    def _remove_reader_process(self, idx):
+        """
+        Remove the events reader from the process manager to prevent restarting it
+
+        ProcessManager has no public API to stop managing the process, so it
+        relies on ``_process_map`` of the process details by PID as it is
+        in Salt 3006. The reader is looked up by the index in the arguments
+        as the process manager restarts the exited processes with the new PID.
+
+        :return: The process of the reader or None if it's not managed
+        """
+
+        process_map = self.process_manager._process_map
+        for pid, mapping in list(process_map.items()):
+            if mapping["tgt"] is EventsReader and mapping["args"][3] == idx:
+                process_map.pop(pid, None)
+                return mapping["Process"]
+        return None
+
+    def _retire_reader(self, idx):
+        self._readers.pop(idx, None)
+        process = self._remove_reader_process(idx)
+        if process is not None:
+            self._readers_retired[idx] = process
+        # The reader exits on its own once the current batch is processed
+        self._readers_stop[idx] = 1
+
+    def autoscale_readers(self):
+        """
+        Add or retire the events readers depending on the request queue backlog
+        """
+
+        # Reap the retired readers which have already exited
+        self._readers_retired = {
+            idx: process
+            for idx, process in self._readers_retired.items()
+            if process.is_alive()
+        }
+
+        try:
+            # The queue passes the events in batches of up to events_batch_size,
+            # the queued batches are counted as full ones
+            backlog = self.req_queue.qsize() * self._batch_size
+        except NotImplementedError:
+            return
+
+        readers_count = len(self._readers)
+        ts = time()
+        # The index of the retired reader still running can't be reused
+        # as starting the reader resets the stop flag of the index
+        free_idxs = set(range(self._readers_max)).difference(
+            self._readers, self._readers_retired
+        )
+        if (
+            backlog > self.opts.get("readers_scale_up_backlog", 1000) * readers_count
+            and readers_count < self._readers_max
+            and free_idxs
+        ):
+            idx = min(free_idxs)
+            log.info(
+                "Adding events reader %d as %d events are waiting in the queue",
+                idx,
+                backlog,
+            )
+            self._start_reader(idx)
+            self._readers_scaled["up"] += 1
+            self._readers_low_since = None
+        elif (
+            backlog <= self.opts.get("readers_scale_down_backlog", 10)
+            and readers_count > self._readers_min
+        ):
+            if self._readers_low_since is None:
+                self._readers_low_since = ts
+            elif ts - self._readers_low_since >= self.opts.get(
+                "readers_scale_down_after", 60
+            ):
+                idx = max(self._readers)
+                log.info(
+                    "Retiring events reader %d as %d events are waiting in the queue",
+                    idx,
+                    backlog,
+                )
+                self._retire_reader(idx)
+                self._readers_scaled["down"] += 1
+                self._readers_low_since = ts
+        else:
+            self._readers_low_since = None
+
+        self.ret_queue.put(
+            {
+                "internal": {
+                    (Metrics.SALINE_INTERNAL_READERS, None): len(self._readers),
+                    (
+                        Metrics.SALINE_INTERNAL_READERS_SCALED,
+                        ("up",),
+                    ): self._readers_scaled["up"],
+                    (
+                        Metrics.SALINE_INTERNAL_READERS_SCALED,
+                        ("down",),
+                    ): self._readers_scaled["down"],
+                },
+            }
+        )
 
     def _handle_signals(self, signum, sigframe):
         # escalate the signals to the process manager
         self.process_manager._handle_signals(signum, sigframe)
         sleep(1)
+        self._close_queues()
         sys.exit(0)
 
 
@@ -113,90 +311,232 @@ class EventsManager(SignalHandlingProcess):
     The Saline Events Manager process
     """
 
-    def __init__(self, opts, queue, **kwargs):
+    def __init__(self, opts, queues, ret_queue, **kwargs):
         """
         Create a Saline Events Manager instance
 
         :param dict opts: The Saline options
-        :param Queue queue: The queue to put the captured events to
+        :param list queues: The queues to distribute the captured events to
+        :param Queue ret_queue: The queue to put the internal metrics to
         """
 
         super().__init__()
 
         self.name = "EventsManager"
 
-        self.event_bus = None
-
         self.opts = opts
-        self.queue = queue
+        self.queues = queues
+        self.ret_queue = ret_queue
 
-        self.mopts = None
+        self._source = None
 
-        self._salt_events = None
+        self._int_queue = None
+        self._int_queue_thread = None
 
-        self._int_queue = []
+        self._raw_forwarding = self.opts.get("events_raw_forwarding", False)
+        self._tagend = salt.utils.stringutils.to_bytes(TAGEND)
 
-        self._last_reconnect = 0
+        self._capture = None
+        self._stop = False
+
+        self._shedder = None
+        self._batch_size = max(self.opts.get("events_batch_size", 1), 1)
+        self._queued = 0
+        self._queued_checked = 0
 
     def process_events(self):
-        events_filter_re = re.compile(self.opts["events_regex_filter"])
-        events_additional = []
-        for add_filter in self.opts.get("events_additional", []):
-            events_additional.append(re.compile(add_filter))
+        tag_filter = TagFilter(
+            [
+                self.opts["events_regex_filter"],
+                *self.opts.get("events_additional", []),
+            ],
+            cache_size=self.opts.get("events_filter_cache_size", 4096),
+        )
 
-        while True:
-            sleep(0.2)
-            while self._int_queue:
-                tag, event = self._int_queue.pop(0)
+        batcher = ShardedBatcher(
+            self.queues,
+            batch_size=self.opts.get("events_batch_size", 1),
+            batch_timeout=self.opts.get("events_batch_timeout", 50),
+        )
 
-                if not isinstance(event, dict):
-                    continue
+        if self.opts.get("events_shedding", False):
+            self._shedder = LoadShedder(
+                self.opts.get("events_shedding_classes", []),
+                cache_size=self.opts.get("events_filter_cache_size", 4096),
+            )
 
-                if events_filter_re.match(tag):
-                    self.queue.put((tag, event))
-                    continue
+        capture_file = self.opts.get("events_capture_file")
+        if capture_file:
+            log.info("Capturing the events to: %s", capture_file)
+            self._capture = EventsCaptureWriter(
+                capture_file, compress=self.opts.get("events_capture_compress", False)
+            )
 
-                in_additional = False
-                for filter_re in events_additional:
-                    if filter_re.match(tag):
-                        in_additional = True
-                        break
-                if in_additional:
-                    self.queue.put((tag, event))
-                    continue
+        while not self._stop:
+            self._filter_event(tag_filter, batcher)
 
-                log.debug("The event tag doesn't match the event filter: %s", tag)
+        # The capture is closed by the thread writing to it
+        # to not leave the record or the zstd frame incomplete
+        if self._capture is not None:
+            self._capture.close()
+            self._capture = None
+
+    def _filter_event(self, tag_filter, batcher):
+        """
+        Get the next event from the internal queue and pass it to the batcher
+        if it matches the events filter
+        """
+
+        try:
+            # Wake up at least every second to flush the capture
+            # and to check if the thread has to stop
+            tag, event, received, trimmed = self._int_queue.get(
+                timeout=batcher.timeout(1)
+            )
+        except QueueEmpty:
+            batcher.flush_due()
+            if self._capture is not None:
+                try:
+                    self._capture.flush()
+                except OSError as exc:
+                    self._stop_capture(exc)
+            return
+
+        if not isinstance(event, (dict, bytes)):
+            pass
+        elif not tag_filter.match(tag):
+            log.debug("The event tag doesn't match the event filter: %s", tag)
+        else:
+            if self._capture is not None:
+                try:
+                    # Capture the wall-clock time the event was received at
+                    # to replay the events with the original intervals
+                    # even if they were waiting in the queue
+                    self._capture.write(
+                        tag, event, ts=time() - (monotonic() - received)
+                    )
+                except Exception as exc:  # pylint: disable=broad-except
+                    # Like the disk is full or the event can't be serialized
+                    self._stop_capture(exc)
+            meta = {"stamps": [received, monotonic()], "trimmed": trimmed}
+            weight = 1
+            if self._shedder:
+                weight = self._shedder.weight(tag, self._get_backlog())
+            if weight > 1:
+                # The counters of the sampled events are scaled back up
+                meta["weight"] = weight
+            if weight:
+                batcher.put(get_shard_key(tag, event), (tag, event, meta))
+
+        # The queue timeout is never reached while the events keep coming,
+        # including the filtered out ones, so the pending batches of all
+        # of the shards are checked after each event
+        batcher.flush_due()
+
+    def _stop_capture(self, exc):
+        log.error(
+            "Unable to capture the events to %s, the capturing is stopped: %s",
+            self._capture.path,
+            exc,
+        )
+        capture, self._capture = self._capture, None
+        with contextlib.suppress(Exception):
+            capture.close()
 
     @salt.ext.tornado.gen.coroutine
     def enqueue_event(self, raw):
         try:
-            self._int_queue.append(self.event_bus.unpack(raw))
+            if self._raw_forwarding and isinstance(raw, bytes):
+                # Decode the tag only and leave the payload
+                # to be decoded by the events readers
+                tag, _, payload = raw.partition(self._tagend)
+                self._int_queue.put(
+                    (salt.utils.stringutils.to_str(tag), payload, monotonic(), None)
+                )
+            else:
+                # The raw scan is much cheaper than walking through the decoded data
+                trimmed = b"VALUE_TRIMMED" in raw if isinstance(raw, bytes) else None
+                self._int_queue.put((*SaltEvent.unpack(raw), monotonic(), trimmed))
         except:  # pylint: disable=broad-except
             # Just to ignore any possible exceptions on unpacking data
             pass
 
-    def _init_event_bus(self):
-        if self.event_bus is not None:
-            self.event_bus.destroy()
-        self.event_bus = get_event(
-            "master",
-            listen=True,
-            io_loop=self.io_loop,
-            opts=self.mopts,
-            raise_errors=False,
-            keep_loop=True,
-        )
-        self.event_bus.set_event_handler(self.enqueue_event)
+    def enqueue(self, tag, data):
+        """
+        Put the decoded event, or the event with the raw payload, to the internal queue
+
+        :param str tag: The tag of the event
+        :param data: The data of the event or the raw msgpack payload
+        """
+
+        trimmed = b"VALUE_TRIMMED" in data if isinstance(data, bytes) else None
+        self._int_queue.put((tag, data, monotonic(), trimmed))
+
+    def _get_backlog(self):
+        """
+        Get the number of the events waiting to be filtered, parsed and merged:
+        the events in the internal queue and in the request queues to the readers
+        and in the returns queue to the Data Manager. The queues pass the events
+        in batches of up to ``events_batch_size`` and only the number
+        of the batches is known, so the queued batches are counted as full ones.
+        The sizes of the queues are checked not more often than every 100 ms.
+        """
+
+        now = monotonic()
+        if now - self._queued_checked >= 0.1:
+            self._queued_checked = now
+            queued = 0
+            for queue in (*self.queues, self.ret_queue):
+                try:
+                    queued += queue.qsize()
+                except NotImplementedError:
+                    pass
+            self._queued = queued * self._batch_size
+        return len(self._int_queue) + self._queued
+
+    def _get_queues_metrics(self):
+        queues = [("ret", self.ret_queue)]
+        if len(self.queues) == 1:
+            queues.append(("req", self.queues[0]))
+        else:
+            queues.extend(
+                [("req-%d" % i, queue) for i, queue in enumerate(self.queues)]
+            )
+        internal = {}
+        for name, queue in queues:
+            try:
+                internal[(Metrics.SALINE_INTERNAL_QUEUE_RECORDS, (name,))] = (
+                    queue.qsize()
+                )
+            except NotImplementedError:
+                # qsize is not implemented for multiprocessing.Queue on some platforms
+                pass
+            # Only the shared memory queues report the bytes used
+            fill = getattr(queue, "fill", None)
+            if fill is not None:
+                internal[(Metrics.SALINE_INTERNAL_QUEUE_FILL_BYTES, (name,))] = fill()
+        return internal
 
     @salt.ext.tornado.gen.coroutine
-    def _check_connected(self):
-        if (
-            not self.event_bus.subscriber.connected()
-            and self._last_reconnect + 10 < time()
-        ):
-            log.warning("Event subscriber stream is not connected. Reconnecting...")
-            self._last_reconnect = time()
-            self._init_event_bus()
+    def _send_internal_metrics(self):
+        in_memory, spilled = self._int_queue.depth()
+        internal = {
+            (Metrics.SALINE_INTERNAL_EVENTS_BUFFER_DEPTH, ("memory",)): in_memory,
+            (Metrics.SALINE_INTERNAL_EVENTS_BUFFER_DEPTH, ("spill",)): spilled,
+            (
+                Metrics.SALINE_INTERNAL_EVENTS_BUFFER_DROPPED,
+                None,
+            ): self._int_queue.dropped,
+            (
+                Metrics.SALINE_INTERNAL_EVENTS_BUFFER_SPILLED,
+                None,
+            ): self._int_queue.spilled,
+        }
+        internal.update(self._get_queues_metrics())
+        if self._shedder:
+            for labels, value in dict(self._shedder.shed).items():
+                internal[(Metrics.SALINE_INTERNAL_EVENTS_SHED, labels)] = value
+        self.ret_queue.put({"internal": internal})
 
     def run(self):
         """
@@ -205,31 +545,37 @@ class EventsManager(SignalHandlingProcess):
 
         log.info("Running Saline Events Manager")
 
-        conf_path = os.path.join(salt.syspaths.CONFIG_DIR, "master")
+        self._source = get_events_source(self.opts, self)
 
-        log.debug("Reading the config: %s", conf_path)
-        self.mopts = salt.config.client_config(conf_path)
-
-        log.debug(
-            "Starting reading salt events from: %s (%s)",
-            self.mopts["sock_dir"],
-            self.mopts["transport"],
+        self._int_queue = EventsBuffer(
+            high_water_mark=self.opts.get("events_buffer_high_water_mark", 100000),
+            policy=self.opts.get("events_buffer_policy", EventsBuffer.POLICY_DROP),
+            spill_dir=self.opts.get("events_buffer_spill_dir"),
+            spill_limit=self.opts.get("events_buffer_spill_limit", 1073741824),
         )
 
         self._int_queue_thread = Thread(target=self.process_events)
         self._int_queue_thread.start()
 
         self.io_loop = IOLoop(make_current=True)
-        self._init_event_bus()
-        self._check_connected_cb = PeriodicCallback(
-            self._check_connected, 3000, io_loop=self.io_loop
+        self._source.start(self.io_loop)
+        self._internal_metrics_cb = PeriodicCallback(
+            self._send_internal_metrics,
+            self.opts.get("internal_metrics_interval", 5) * 1000,
+            io_loop=self.io_loop,
         )
-        self._check_connected_cb.start()
+        self._internal_metrics_cb.start()
         self.io_loop.start()
 
     def _handle_signals(self, signum, sigframe):
-        if self._salt_events is not None:
-            self._salt_events.close()
+        if self._source is not None:
+            self._source.close()
+        self._stop = True
+        if self._int_queue is not None:
+            # Wake up the filter thread waiting for the events
+            self._int_queue.put((None, None, monotonic(), None))
+        if self._int_queue_thread is not None:
+            self._int_queue_thread.join(5)
         sys.exit(0)
 
 
@@ -258,6 +604,7 @@ class DataManager(SignalHandlingProcess):
 
         self.server_thread = None
         self.maintenance_thread = None
+        self.merging_thread = None
 
         self._close_lock = Lock()
 
@@ -282,11 +629,19 @@ class DataManager(SignalHandlingProcess):
         )
 
         self._job_jids_cleanup_interval = self.opts.get("job_jids_cleanup_interval", 30)
+        self._merging_background = self.opts.get("merging_background", True)
+        self._merging_budget = self.opts.get("merging_budget", 200) / 1000
 
         self._maintenance_stop = False
         self.maintenance_thread = Thread(target=self.start_maintenance)
         self.maintenance_thread.start()
 
+        if self._merging_background:
+            # Discovering the merging rules could take long, so it's done
+            # in the separate thread to not delay the maintenance
+            self.merging_thread = Thread(target=self.start_merging, daemon=True)
+            self.merging_thread.start()
+
         self.start_datamerger()
 
     def _handle_signals(self, signum, sigframe):
@@ -295,9 +650,17 @@ class DataManager(SignalHandlingProcess):
         sys.exit(0)
 
     def start_datamerger(self):
+        batch_size = self.opts.get("datamerger_batch_size", 1000)
         while True:
-            data = self.queue.get()
-            self.datamerger.add(data)
+            events = list(unbatch(self.queue.get()))
+            # Take the events already waiting in the queue to merge them at once
+            while len(events) < batch_size:
+                try:
+                    data = self.queue.get(block=False)
+                except QueueEmpty:
+                    break
+                events.extend(unbatch(data))
+            self.datamerger.add_many(events)
 
     def start_maintenance(self):
         ts = time()
@@ -319,6 +682,11 @@ class DataManager(SignalHandlingProcess):
                 run_job_jids_cleanup_after = ts + self._job_jids_cleanup_interval
                 self.datamerger.cleanup_job_jids()
 
+    def start_merging(self):
+        while not self._maintenance_stop:
+            sleep(1)
+            self.datamerger.merge_pending(self._merging_budget)
+
     def stop_maintenance(self):
         if self.maintenance_thread is not None:
             self._maintenance_stop = True
@@ -357,7 +725,11 @@ class DataManager(SignalHandlingProcess):
             ):
                 self.metrics_epoch = epoch
                 last_update = cur_time
+                publish_start = monotonic()
                 self.publisher.publish({"metrics": self.datamerger.get_metrics()})
+                self.datamerger.metrics_published(
+                    cur_time, monotonic() - publish_start
+                )
             yield salt.ext.tornado.gen.sleep(3)
 
     def close(self):
@@ -379,12 +751,13 @@ class EventsReader(SignalHandlingProcess):
     The Saline Events Reader process
     """
 
-    def __init__(self, opts, req_queue, ret_queue, idx, **kwargs):
+    def __init__(self, opts, req_queue, ret_queue, idx, stop_flags=None, **kwargs):
         """
         Create a Saline Events Reader instance
 
         :param dict opts: The Saline options
         :param Queue queue: The queue to put the captured events to
+        :param Array stop_flags: The flags to request the readers to exit by index
         """
 
         super().__init__()
@@ -397,6 +770,7 @@ class EventsReader(SignalHandlingProcess):
         self.ret_queue = ret_queue
 
         self._exit = False
+        self._stop_flags = stop_flags
 
         self.event_parser = EventParser(self.opts)
 
@@ -407,19 +781,94 @@ class EventsReader(SignalHandlingProcess):
 
         log.info("Running Saline Events Reader: %s", self.name)
 
+        batcher = QueueBatcher(
+            self.ret_queue,
+            batch_size=self.opts.get("events_batch_size", 1),
+            batch_timeout=self.opts.get("events_batch_timeout", 50),
+        )
+
+        metrics_interval = self.opts.get("internal_metrics_interval", 5)
+        send_metrics_at = monotonic() + metrics_interval
+
+        aggregator = None
+        aggregation_interval = 1
+        if self.opts.get("readers_aggregation", False):
+            aggregator = EventsAggregator()
+            aggregation_interval = (
+                self.opts.get("readers_aggregation_interval", 250) / 1000
+            )
+        send_deltas_at = monotonic() + aggregation_interval
+
         while True:
+            if monotonic() >= send_metrics_at:
+                self._send_internal_metrics(batcher)
+                send_metrics_at = monotonic() + metrics_interval
+            if aggregator is not None and monotonic() >= send_deltas_at:
+                if aggregator:
+                    batcher.put({"deltas": aggregator.pop_deltas()})
+                send_deltas_at = monotonic() + aggregation_interval
+            if self._stop_flags is not None and self._stop_flags[self._idx]:
+                if aggregator:
+                    batcher.put({"deltas": aggregator.pop_deltas()})
+                batcher.flush()
+                log.info("Retiring Saline Events Reader: %s", self.name)
+                return
             try:
-                event = self.req_queue.get(timeout=1)
+                events = self.req_queue.get(
+                    timeout=batcher.timeout(aggregation_interval)
+                )
             except QueueEmpty:
+                batcher.flush_due()
                 continue
             except (ValueError, OSError):
                 return
             if self._exit:
                 return
-            parsed_data = self.event_parser.parse(*event)
-            if parsed_data is not None:
-                parsed_data["rix"] = self._idx
-                self.ret_queue.put(parsed_data)
+            for tag, data, meta in unbatch(events):
+                trimmed = meta.get("trimmed")
+                if isinstance(data, bytes):
+                    trimmed = b"VALUE_TRIMMED" in data
+                    data = self.decode_payload(tag, data)
+                    if data is None:
+                        continue
+                parsed_data = self.event_parser.parse(tag, data, trimmed=trimmed)
+                if parsed_data is not None:
+                    parsed_data["rix"] = self._idx
+                    if "stamps" in meta:
+                        parsed_data["stamps"] = [*meta["stamps"], monotonic()]
+                    if "weight" in meta:
+                        parsed_data["weight"] = meta["weight"]
+                    if aggregator is not None:
+                        # Only the data not counted already is passed per event
+                        parsed_data = aggregator.add(parsed_data)
+                    batcher.put(parsed_data)
+            batcher.flush_due()
+
+    def _send_internal_metrics(self, batcher):
+        internal = {}
+        for name, cache in (
+            ("tag_masks", get_tag_masks_cache()),
+            ("state_fun_args", get_state_fun_args_cache()),
+        ):
+            for result, value in (("hit", cache.hits), ("miss", cache.misses)):
+                internal[
+                    (Metrics.SALINE_INTERNAL_CACHE_LOOKUPS, (self._idx, name, result))
+                ] = value
+        batcher.put({"internal": internal})
+
+    def decode_payload(self, tag, payload):
+        """
+        Decode the raw event payload forwarded by the Events Manager
+        """
+
+        try:
+            data = salt.payload.loads(payload, encoding="utf-8")
+        except Exception as exc:  # pylint: disable=broad-except
+            log.debug("Unable to decode the payload of the event %s: %s", tag, exc)
+            return None
+        if not isinstance(data, dict):
+            return None
+        return data
 
     def _handle_signals(self, signum, sigframe):
         self._exit = True
@@ -0,0 +1,159 @@
+import logging
+import os
+import pickle
+import struct
+
+from multiprocessing import Lock, Semaphore, Value
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty as QueueEmpty, Full as QueueFull
+from time import monotonic
+
+
+log = logging.getLogger(__name__)
+
+
+class SharedMemoryQueue:
+    """
+    Multi-producer/multi-consumer ring buffer of length-prefixed records
+    in the shared memory, which could be used instead of multiprocessing.Queue
+    """
+
+    # head, tail, puts, gets
+    _HEADER = struct.Struct("=QQQQ")
+    _RECORD_HEAD = struct.Struct("=I")
+
+    # The time slice to recheck the free space while waiting for it
+    _SPACE_WAIT_SLICE = 0.1
+
+    def __init__(self, size=67108864):
+        """
+        Create the shared memory queue
+
+        :param int size: The size of the ring buffer in bytes
+        """
+
+        self._size = size
+        self._shm = SharedMemory(create=True, size=self._HEADER.size + size)
+        self._owner_pid = os.getpid()
+        self._HEADER.pack_into(self._shm.buf, 0, 0, 0, 0, 0)
+        # Producers and consumers are serialized with their own locks only
+        self._put_lock = Lock()
+        self._get_lock = Lock()
+        self._items = Semaphore(0)
+        self._space = Semaphore(0)
+        self._space_waiters = Value("i", 0, lock=False)
+
+    def __getstate__(self):
+        return (
+            self._shm.name,
+            self._size,
+            self._owner_pid,
+            self._put_lock,
+            self._get_lock,
+            self._items,
+            self._space,
+            self._space_waiters,
+        )
+
+    def __setstate__(self, state):
+        (
+            name,
+            self._size,
+            self._owner_pid,
+            self._put_lock,
+            self._get_lock,
+            self._items,
+            self._space,
+            self._space_waiters,
+        ) = state
+        self._shm = SharedMemory(name=name)
+
+    def _write(self, pos, data):
+        pos %= self._size
+        offset = self._HEADER.size
+        first = min(len(data), self._size - pos)
+        self._shm.buf[offset + pos : offset + pos + first] = data[:first]
+        if first < len(data):
+            self._shm.buf[offset : offset + len(data) - first] = data[first:]
+
+    def _read(self, pos, size):
+        pos %= self._size
+        offset = self._HEADER.size
+        first = min(size, self._size - pos)
+        data = bytes(self._shm.buf[offset + pos : offset + pos + first])
+        if first < size:
+            data += bytes(self._shm.buf[offset : offset + size - first])
+        return data
+
+    def put(self, obj, block=True, timeout=None):
+        payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        record_size = self._RECORD_HEAD.size + len(payload)
+        if record_size > self._size:
+            raise ValueError(
+                "The record of %d bytes doesn't fit the ring buffer of %d bytes"
+                % (record_size, self._size)
+            )
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._put_lock:
+            while True:
+                head, tail, puts, _ = self._HEADER.unpack_from(self._shm.buf, 0)
+                if self._size - (head - tail) >= record_size:
+                    break
+                wait = self._SPACE_WAIT_SLICE
+                if deadline is not None:
+                    wait = min(wait, deadline - monotonic())
+                if not block or wait <= 0:
+                    raise QueueFull
+                self._space_waiters.value += 1
+                self._space.acquire(timeout=wait)
+                self._space_waiters.value -= 1
+            self._write(head, self._RECORD_HEAD.pack(len(payload)))
+            self._write(head + self._RECORD_HEAD.size, payload)
+            # Publish the record only after it was written completely
+            struct.pack_into("=Q", self._shm.buf, 0, head + record_size)
+            struct.pack_into("=Q", self._shm.buf, 16, puts + 1)
+        self._items.release()
+
+    def get(self, block=True, timeout=None):
+        if not self._items.acquire(block, timeout):
+            raise QueueEmpty
+        with self._get_lock:
+            _, tail, _, gets = self._HEADER.unpack_from(self._shm.buf, 0)
+            (size,) = self._RECORD_HEAD.unpack(
+                self._read(tail, self._RECORD_HEAD.size)
+            )
+            payload = self._read(tail + self._RECORD_HEAD.size, size)
+            struct.pack_into(
+                "=Q", self._shm.buf, 8, tail + self._RECORD_HEAD.size + size
+            )
+            struct.pack_into("=Q", self._shm.buf, 24, gets + 1)
+        if self._space_waiters.value:
+            self._space.release()
+        return pickle.loads(payload)
+
+    def qsize(self):
+        """
+        Get the number of records in the ring buffer
+        """
+
+        _, _, puts, gets = self._HEADER.unpack_from(self._shm.buf, 0)
+        return puts - gets
+
+    def fill(self):
+        """
+        Get the number of bytes used in the ring buffer
+        """
+
+        head, tail, _, _ = self._HEADER.unpack_from(self._shm.buf, 0)
+        return head - tail
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def close(self):
+        self._shm.close()
+        if self._owner_pid == os.getpid():
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,216 @@
+import abc
+import importlib
+import logging
+import os
+
+import salt.config
+import salt.ext.tornado.gen
+import salt.syspaths
+
+from threading import Thread
+from time import monotonic, sleep, time
+
+from saline.capture import read_capture
+
+from salt.ext.tornado.ioloop import PeriodicCallback
+from salt.utils.event import get_event
+
+log = logging.getLogger(__name__)
+
+
+class EventsSource(abc.ABC):
+    """
+    Base class of the sources of the events for the Saline Events Manager
+
+    The source is started in the Events Manager process with the IO loop
+    of the process and passes the events to the Events Manager with
+    ``manager.enqueue_event(raw)`` for the raw events from the Salt Event Bus
+    or with ``manager.enqueue(tag, data)`` for the decoded ones.
+    """
+
+    def __init__(self, opts, manager):
+        """
+        Create the events source
+
+        :param dict opts: The Saline options
+        :param EventsManager manager: The Events Manager to pass the events to
+        """
+
+        self.opts = opts
+        self.manager = manager
+        self.io_loop = None
+
+    @abc.abstractmethod
+    def start(self, io_loop):
+        """
+        Start passing the events to the Events Manager
+
+        :param IOLoop io_loop: The IO loop of the Events Manager process
+        """
+
+    def close(self):
+        """
+        Stop passing the events and release the resources of the source
+        """
+
+
+class SaltEventBusSource(EventsSource):
+    """
+    The events source reading the events from the Salt Event Bus of the Salt Master
+    """
+
+    def __init__(self, opts, manager):
+        super().__init__(opts, manager)
+
+        self.event_bus = None
+        self.mopts = None
+
+        self._last_reconnect = 0
+        self._check_connected_cb = None
+
+    def start(self, io_loop):
+        self.io_loop = io_loop
+
+        conf_path = self.opts.get("events_source_master_config") or os.path.join(
+            salt.syspaths.CONFIG_DIR, "master"
+        )
+
+        log.debug("Reading the config: %s", conf_path)
+        self.mopts = salt.config.client_config(conf_path)
+        sock_dir = self.opts.get("events_source_sock_dir")
+        if sock_dir:
+            self.mopts["sock_dir"] = sock_dir
+
+        log.debug(
+            "Starting reading salt events from: %s (%s)",
+            self.mopts["sock_dir"],
+            self.mopts["transport"],
+        )
+
+        self._init_event_bus()
+        self._check_connected_cb = PeriodicCallback(
+            self._check_connected, 3000, io_loop=self.io_loop
+        )
+        self._check_connected_cb.start()
+
+    def _init_event_bus(self):
+        if self.event_bus is not None:
+            self.event_bus.destroy()
+        self.event_bus = get_event(
+            "master",
+            listen=True,
+            io_loop=self.io_loop,
+            opts=self.mopts,
+            raise_errors=False,
+            keep_loop=True,
+        )
+        self.event_bus.set_event_handler(self.manager.enqueue_event)
+
+    @salt.ext.tornado.gen.coroutine
+    def _check_connected(self):
+        if (
+            not self.event_bus.subscriber.connected()
+            and self._last_reconnect + 10 < time()
+        ):
+            log.warning("Event subscriber stream is not connected. Reconnecting...")
+            self._last_reconnect = time()
+            self._init_event_bus()
+
+    def close(self):
+        if self._check_connected_cb is not None:
+            self._check_connected_cb.stop()
+        if self.event_bus is not None:
+            self.event_bus.destroy()
+            self.event_bus = None
+
+
+class CaptureReplaySource(EventsSource):
+    """
+    The events source replaying the events from the capture file
+    """
+
+    def __init__(self, opts, manager):
+        super().__init__(opts, manager)
+
+        self.path = self.opts.get("events_replay_file")
+        self.speed = self.opts.get("events_replay_speed", 1)
+
+        self._stop = False
+        self._thread = None
+
+    def start(self, io_loop):
+        if not self.path:
+            raise ValueError("The capture file to replay the events from is not set")
+        self.io_loop = io_loop
+        self._thread = Thread(target=self.replay_events, daemon=True)
+        self._thread.start()
+
+    def replay_events(self):
+        """
+        Replay the events from the capture file keeping the original
+        intervals between the events divided by the speed
+        """
+
+        log.info(
+            "Replaying the events from: %s (speed: %s)",
+            self.path,
+            self.speed if self.speed > 0 else "max",
+        )
+        count = 0
+        started = monotonic()
+        first_ts = None
+        try:
+            for ts, tag, data in read_capture(self.path):
+                if self._stop:
+                    break
+                if first_ts is None:
+                    first_ts = ts
+                if self.speed > 0:
+                    delay = started + (ts - first_ts) / self.speed - monotonic()
+                    if delay > 0:
+                        sleep(delay)
+                self.manager.enqueue(tag, data)
+                count += 1
+        except (OSError, RuntimeError, ValueError) as exc:
+            log.error("Unable to replay the events from %s: %s", self.path, exc)
+        duration = monotonic() - started
+        log.info(
+            "Replayed %d events in %.3f seconds (%.1f events/s)",
+            count,
+            duration,
+            count / duration if duration else 0,
+        )
+
+    def close(self):
+        self._stop = True
+
+
+EVENTS_SOURCES = {
+    "salt": SaltEventBusSource,
+    "replay": CaptureReplaySource,
+}
+
+
+def get_events_source(opts, manager):
+    """
+    Create the events source specified with ``events_source`` option
+
+    :param dict opts: The Saline options
+    :param EventsManager manager: The Events Manager to pass the events to
+
+    The source is one of the bundled ones (``salt`` or ``replay``)
+    or the path to the custom one as ``package.module:ClassName``.
+    """
+
+    name = opts.get("events_source", "salt")
+    if name == "salt" and opts.get("events_replay_file"):
+        # Keep replaying with just the capture file specified
+        name = "replay"
+    source_cls = EVENTS_SOURCES.get(name)
+    if source_cls is None:
+        module_name, _, cls_name = name.partition(":")
+        if not cls_name:
+            raise ValueError("Unknown events source: %s" % name)
+        source_cls = getattr(importlib.import_module(module_name), cls_name)
+    log.debug("Using the events source: %s", name)
+    return source_cls(opts, manager)
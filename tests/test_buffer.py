@@ -0,0 +1,71 @@
+from queue import Empty as QueueEmpty
+
+import pytest
+
+from saline.buffer import EventsBuffer
+
+
+def _get_all(events_buffer):
+    items = []
+    while True:
+        try:
+            items.append(events_buffer.get(timeout=0))
+        except QueueEmpty:
+            return items
+
+
+def test_events_above_high_water_mark_are_dropped():
+    events_buffer = EventsBuffer(high_water_mark=3)
+
+    assert [events_buffer.put(i) for i in range(5)] == [True] * 3 + [False] * 2
+    assert events_buffer.dropped == 2
+    assert _get_all(events_buffer) == [0, 1, 2]
+
+
+def test_spilled_events_are_reloaded_in_order(tmp_path):
+    events_buffer = EventsBuffer(
+        high_water_mark=3, policy=EventsBuffer.POLICY_SPILL, spill_dir=str(tmp_path)
+    )
+    for i in range(10):
+        assert events_buffer.put(("tag", {"i": i}))
+    assert events_buffer.depth() == (3, 7)
+    assert events_buffer.spilled == 7
+
+    # The new events go after the spilled ones even when the memory is freed
+    assert events_buffer.get(timeout=0) == ("tag", {"i": 0})
+    events_buffer.put(("tag", {"i": 10}))
+    items = _get_all(events_buffer)
+
+    assert [data["i"] for _, data in items] == list(range(1, 11))
+    assert events_buffer.depth() == (0, 0)
+    assert events_buffer.dropped == 0
+
+
+def test_spill_file_is_reused_after_reading_it(tmp_path):
+    events_buffer = EventsBuffer(
+        high_water_mark=2, policy=EventsBuffer.POLICY_SPILL, spill_dir=str(tmp_path)
+    )
+    for round_ in range(3):
+        for i in range(5):
+            events_buffer.put((round_, i))
+        assert _get_all(events_buffer) == [(round_, i) for i in range(5)]
+        assert events_buffer._spill_write_pos == 0
+
+
+def test_events_are_dropped_above_spill_limit(tmp_path):
+    events_buffer = EventsBuffer(
+        high_water_mark=1,
+        policy=EventsBuffer.POLICY_SPILL,
+        spill_dir=str(tmp_path),
+        spill_limit=64,
+    )
+    results = [events_buffer.put("x" * 20) for _ in range(5)]
+
+    assert results[0] and not results[-1]
+    assert events_buffer.dropped == results.count(False)
+    assert len(_get_all(events_buffer)) == results.count(True)
+
+
+def test_get_waits_for_timeout():
+    with pytest.raises(QueueEmpty):
+        EventsBuffer().get(timeout=0.01)
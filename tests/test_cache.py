@@ -0,0 +1,32 @@
+from saline.data.cache import LRUCache
+
+
+def test_least_recently_used_is_evicted():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # The lookup makes "a" the most recently used one
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_hits_and_misses_are_counted():
+    cache = LRUCache(2)
+    cache.set("a", None)
+
+    assert cache.get("a", "missing") is None
+    assert cache.get("b", "missing") == "missing"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_zero_size_cache_keeps_nothing():
+    cache = LRUCache(0)
+    cache.set("a", 1)
+
+    assert len(cache) == 0
+    assert cache.get("a") is None
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from saline.capture import EventsCaptureWriter, read_capture, zstandard
+
+
+EVENTS = [
+    (1681812000.0, "salt/job/20230418100000000001/new", {"fun": "test.ping"}),
+    (1681812000.5, "salt/auth", {"act": "accept", "id": "minion1"}),
+    (1681812001.0, "salt/job/20230418100000000001/ret/minion1", b"\x81\xa3fun"),
+]
+
+
+def _write(path, events, compress=False):
+    capture = EventsCaptureWriter(path, compress=compress)
+    for ts, tag, data in events:
+        capture.write(tag, data, ts=ts)
+    capture.close()
+    return capture.count
+
+
+@pytest.mark.parametrize(
+    "compress",
+    [
+        False,
+        pytest.param(
+            True,
+            marks=pytest.mark.skipif(
+                zstandard is None, reason="zstandard is not available"
+            ),
+        ),
+    ],
+)
+def test_capture_round_trip(tmp_path, compress):
+    path = str(tmp_path / "events.capture")
+
+    assert _write(path, EVENTS[:2], compress=compress) == 2
+    # The writer appends to the existing capture file
+    assert _write(path, EVENTS[2:], compress=compress) == 1
+
+    assert [tuple(event) for event in read_capture(path)] == EVENTS
+
+
+def test_incomplete_last_record_is_skipped(tmp_path):
+    path = str(tmp_path / "events.capture")
+    _write(path, EVENTS)
+    with open(path, "r+b") as fh:
+        fh.truncate(os.path.getsize(path) - 1)
+
+    assert [tuple(event) for event in read_capture(path)] == EVENTS[:2]
@@ -0,0 +1,46 @@
+import copy
+
+import pytest
+
+from benchmarks.generator import EventsGenerator
+from saline.data.event import EventParser
+
+
+OPTS = {
+    "rename_rules": {
+        "sls": {r"packages\.packages_\d+": "packages.packages_*"},
+        "sid": {r"pkg_\d+": "pkg_*"},
+    },
+}
+
+
+def _get_returns():
+    return [
+        (tag, data)
+        for tag, data in EventsGenerator(minions=10, states=20, jobs=2).events()
+        if "/ret/" in tag and isinstance(data.get("return"), dict)
+    ]
+
+
+@pytest.mark.parametrize("compact", [True, False])
+def test_state_templates_are_shared_between_returns(compact):
+    opts = dict(OPTS, compact_state_results=compact)
+    returns = _get_returns()
+    event_parser = EventParser(opts)
+
+    for tag, data in returns:
+        # The same as parsing each of the returns without the templates cached
+        assert event_parser.parse(tag, copy.deepcopy(data)) == EventParser(
+            opts
+        ).parse(tag, copy.deepcopy(data))
+
+    rtags = {rtag for _, data in returns for rtag in data["return"]}
+    assert 0 < len(event_parser._state_templates) <= len(rtags)
+
+
+def test_state_templates_cache_is_bounded():
+    event_parser = EventParser(dict(OPTS, state_templates_cache_size=5))
+
+    for tag, data in _get_returns():
+        event_parser.parse(tag, data)
+        assert len(event_parser._state_templates) <= 5
@@ -0,0 +1,56 @@
+import re
+
+from saline.data.filter import TagFilter
+
+
+def test_backreferences_are_not_renumbered():
+    tag_filter = TagFilter([r"salt/(job)/\d+/new", r"salt/(\w+)/\1/x"])
+
+    assert tag_filter.match("salt/job/1/new")
+    assert tag_filter.match("salt/ab/ab/x")
+    assert not tag_filter.match("salt/ab/cd/x")
+    assert not tag_filter.match("salt/ab/job/x")
+
+
+PATTERNS = [
+    r"salt/job/\d+/new",
+    r"salt/job/\d+/ret/.*",
+    r"salt/auth",
+    r"salt/(key|presence)/.*",
+    r"minion/refresh/.*",
+    r"salt/beacon/[^/]+/inotify/.*",
+    r".*/custom$",
+    r"salt/run/\d+/(new|ret)",
+    r"salt/b(atch)?/\d+/start",
+]
+
+TAGS = [
+    "salt/job/20230418100000000001/new",
+    "salt/job/20230418100000000001/ret/minion1",
+    "salt/job/x/new",
+    "salt/auth",
+    "salt/authx",
+    "salt/key",
+    "salt/key/minion1",
+    "salt/presence/present",
+    "minion/refresh/minion1",
+    "minion/start",
+    "salt/beacon/minion1/inotify/etc/x",
+    "salt/beacon/minion1/diskusage/",
+    "salt/custom",
+    "some/other/custom",
+    "salt/run/20230418100000000001/new",
+    "salt/run/20230418100000000001/args",
+    "salt/batch/20230418100000000001/start",
+    "salt/b/20230418100000000001/start",
+    "salt",
+    "",
+]
+
+
+def test_tag_filter_matches_the_patterns_one_by_one():
+    for cache_size in (0, 4096):
+        tag_filter = TagFilter(PATTERNS, cache_size=cache_size)
+        for tag in TAGS:
+            expected = any(re.match(pattern, tag) for pattern in PATTERNS)
+            assert tag_filter.match(tag) is expected, tag
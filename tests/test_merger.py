@@ -0,0 +1,96 @@
+import copy
+import threading
+
+from time import monotonic
+
+from benchmarks.generator import EventsGenerator
+from saline.data import metrics
+from saline.data.event import EventParser
+from saline.data.merger import DataMerger, EventsAggregator
+from saline.data.parser import EventTags
+
+
+def _get_events(**kwargs):
+    return list(EventsGenerator(minions=5, states=20, jobs=3, **kwargs).events())
+
+
+def _merge(opts, events, aggregator=None, deltas_every=10):
+    event_parser = EventParser(opts)
+    datamerger = DataMerger(opts)
+    parsed = []
+    for tag, data in events:
+        parsed_data = event_parser.parse(tag, copy.deepcopy(data))
+        if parsed_data is not None:
+            parsed_data["rix"] = 0
+            parsed.append(parsed_data)
+            if aggregator is not None:
+                parsed_data = aggregator.add(parsed_data)
+            datamerger.add(parsed_data)
+        if aggregator is not None and len(parsed) % deltas_every == 0:
+            datamerger.add_deltas(aggregator.pop_deltas())
+    if aggregator is not None:
+        datamerger.add_deltas(aggregator.pop_deltas())
+    datamerger.jobs_metrics_update()
+    return parsed, datamerger.get_metrics()
+
+
+def test_compact_state_results_are_merged_as_full_returns():
+    events = _get_events()
+
+    compact, compact_metrics = _merge({"compact_state_results": True}, events)
+    full, full_metrics = _merge({"compact_state_results": False}, events)
+
+    assert any("state_results" in data for data in compact)
+    assert not any("return" in data for data in compact)
+    assert any("return" in data for data in full)
+    assert "salt_state_results{" in compact_metrics
+    assert compact_metrics == full_metrics
+
+
+def test_aggregated_deltas_are_merged_as_events():
+    events = _get_events(trimmed_ratio=0.1)
+
+    _, metrics = _merge({}, events)
+    _, aggregated_metrics = _merge({}, events, aggregator=EventsAggregator())
+
+    assert "salt_events_trimmed_count" in metrics
+    assert aggregated_metrics == metrics
+
+
+class CountingLock:
+    acquired = 0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        CountingLock.acquired += 1
+        return self._lock.__enter__()
+
+    def __exit__(self, *args):
+        return self._lock.__exit__(*args)
+
+
+def test_batch_is_applied_to_metrics_at_once(monkeypatch):
+    monkeypatch.setattr(metrics, "Lock", CountingLock)
+    event_parser = EventParser({})
+    datamerger = DataMerger({})
+    parsed = []
+    now = monotonic()
+    for tag, data in _get_events():
+        parsed_data = event_parser.parse(tag, data)
+        # The master stats events are merged with the previous values
+        # of the stats metrics, so they are applied one by one
+        if parsed_data is not None and parsed_data["tag_main"] != EventTags.SALT_STATS:
+            parsed_data["stamps"] = [now, now, now]
+            parsed.append(parsed_data)
+    epoch = datamerger.get_metrics_epoch()
+    CountingLock.acquired = 0
+    datamerger.add_many(parsed)
+
+    assert CountingLock.acquired == 1
+    assert datamerger.get_metrics_epoch() == epoch + 1
+    assert 'saline_internal_pipeline_latency_seconds_count{stage="total"} %d' % (
+        len(parsed)
+    ) in datamerger.get_metrics()
+    assert "saline_internal_events_lag_seconds " in datamerger.get_metrics()
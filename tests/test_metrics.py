@@ -0,0 +1,71 @@
+from time import monotonic
+
+from saline.data.merger import DataMerger
+from saline.data.metrics import Metrics, MetricsCollection
+
+
+def test_latency_observations_do_not_update_epoch():
+    datamerger = DataMerger({})
+    epoch = datamerger.get_metrics_epoch()
+    now = monotonic()
+    for _ in range(3):
+        datamerger.add_many(
+            [{"counted": True, "stamps": [now - 0.3, now - 0.2, now - 0.1]}]
+        )
+
+    assert datamerger.get_metrics_epoch() == epoch
+    assert 'saline_internal_pipeline_latency_seconds_count{stage="total"} 3' in (
+        datamerger.get_metrics()
+    )
+
+
+def test_observe_updates_epoch_by_default():
+    metrics = MetricsCollection()
+    epoch = metrics.get_epoch()
+    metrics.observe(Metrics.SALINE_INTERNAL_PIPELINE_LATENCY, ("total",), 0.1)
+
+    assert metrics.get_epoch() == epoch + 1
+
+
+def test_snapshot_is_not_changed_by_updates():
+    metrics = MetricsCollection()
+    labels = ("top", "pkgs", "pkg.installed", "succeeded")
+    metrics.inc(Metrics.SALT_STATE_RESULTS, labels)
+    metrics.observe(Metrics.SALINE_INTERNAL_PIPELINE_LATENCY, ("total",), 0.1)
+    entries = [(me, me.snapshot()) for me in metrics.metrics.values()]
+    label_values = metrics.labels.get_values()
+    buf = metrics.get_buf()
+
+    metrics.inc(Metrics.SALT_STATE_RESULTS, labels)
+    metrics.inc(Metrics.SALT_STATE_RESULTS, ("top", "users", "user.present", "failed"))
+    metrics.observe(Metrics.SALINE_INTERNAL_PIPELINE_LATENCY, ("total",), 0.1)
+
+    assert "".join(me.render(snapshot, label_values) for me, snapshot in entries) == buf
+    assert 'sls="top",sid="pkgs",fun="pkg.installed",status="succeeded"} 1' in buf
+    assert 'status="succeeded"} 2' in metrics.get_buf()
+
+
+def test_label_values_of_moved_series_are_released():
+    metrics = MetricsCollection()
+    metric = Metrics.SALT_STATE_RESULTS
+    for i in range(1000):
+        metrics.inc(metric, ("top", "pkg_%d" % i, "pkg.installed", "succeeded"))
+    assert len(metrics.labels) == 1003
+
+    for i in range(1000):
+        metrics.move(
+            metric,
+            ("top", "pkg_%d" % i, "pkg.installed", "succeeded"),
+            ("top", "pkg_*", "pkg.installed", "succeeded"),
+        )
+    assert len(metrics.labels) == 4
+
+    # The released integers are reused for the new values
+    metrics.inc(metric, ("top", "user_1", "user.present", "failed"))
+    assert len(metrics.labels) == 7
+    assert sorted(metrics.get_buf().splitlines()[2:]) == [
+        'salt_state_results{sls="top",sid="pkg_*",fun="pkg.installed",'
+        'status="succeeded"} 1000',
+        'salt_state_results{sls="top",sid="user_1",fun="user.present",'
+        'status="failed"} 1',
+    ]
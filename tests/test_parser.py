@@ -0,0 +1,176 @@
+import calendar
+import copy
+
+from datetime import datetime
+from time import time
+
+import pytest
+
+from saline.data import parser
+from saline.data.event import EventParser
+from saline.data.parser import (
+    EventTags,
+    get_jid_timestamp,
+    get_shard_key,
+    get_state_fun_args_cache,
+    get_tag_mask,
+    get_tag_masks_cache,
+    get_timestamp,
+    get_trimmed,
+    parse_state_fun_args,
+)
+
+
+def test_job_returns_are_sharded_by_minion():
+    jid = "20230418100000000001"
+
+    assert get_shard_key("salt/job/%s/new" % jid) == jid
+    assert get_shard_key("salt/job/%s/prog/minion1/0" % jid) == jid
+    assert get_shard_key("salt/job/%s/ret/minion1" % jid) == "minion1"
+    assert get_shard_key("salt/job/%s/ret/minion2" % jid) == "minion2"
+    assert get_shard_key("salt/run/%s/ret" % jid) == jid
+
+
+def test_minion_events_are_sharded_by_minion():
+    assert get_shard_key("salt/minion/minion1/start") == "minion1"
+    assert get_shard_key("minion/refresh/minion1") == "minion1"
+    assert get_shard_key("custom", {"id": "minion1"}) == "minion1"
+    assert get_shard_key("custom", {}) == "custom"
+
+
+def test_per_minion_tags_share_the_cache_entries():
+    cache = get_tag_masks_cache()
+    minions = ["minion%05d" % i for i in range(100)]
+    tags = {
+        "salt/minion/%s/start": ("salt/minion/*/start", EventTags.SALT_MINION_START),
+        "minion/refresh/%s": ("minion/refresh/*", EventTags.SALT_MINION_REFRESH),
+        "salt/beacon/%s/inotify/etc": (
+            "salt/beacon/*/inotify/etc",
+            EventTags.SALT_BEACON,
+        ),
+    }
+    size = len(cache)
+
+    for minion in minions:
+        for tag, (tag_mask, tag_main) in tags.items():
+            tag %= minion
+            expected_minion = None if "beacon" in tag else minion
+            assert get_tag_mask(tag, return_all=True, return_minion_id=True) == (
+                tag_mask,
+                tag_main,
+                None,
+                expected_minion,
+            ), tag
+    assert len(cache) <= size + len(tags)
+
+
+@pytest.fixture(params=["fromisoformat", "strptime"])
+def iso_parser(request, monkeypatch):
+    if request.param == "strptime":
+        # The same as on Python 3.6 without datetime.fromisoformat
+        monkeypatch.setattr(parser, "__fromisoformat", parser.__strptime_iso)
+
+
+def test_naive_stamp_is_utc(iso_parser):
+    expected = calendar.timegm((2023, 4, 18, 10, 0, 0)) + 0.123456
+
+    assert get_timestamp("2023-04-18T10:00:00.123456") == pytest.approx(expected)
+    assert get_timestamp("2023-04-18T10:00:00") == expected - 0.123456
+
+
+def test_invalid_stamp_is_current_time(iso_parser):
+    started = time()
+
+    assert started <= get_timestamp("not a timestamp") <= time()
+    assert started <= get_timestamp(None) <= time()
+
+
+def test_jid_timestamp(iso_parser):
+    expected = calendar.timegm((2023, 4, 18, 10, 0, 0)) + 0.123456
+
+    assert get_jid_timestamp("20230418100000123456", utc=True) == pytest.approx(
+        expected
+    )
+    assert get_jid_timestamp(
+        "20230418100000123456_1234", utc=True
+    ) == pytest.approx(expected)
+    assert get_jid_timestamp("20230418100000123456") == pytest.approx(
+        datetime(2023, 4, 18, 10, 0, 0, 123456).timestamp()
+    )
+    assert get_jid_timestamp("req") is None
+    assert get_jid_timestamp("20231318100000123456") is None
+
+
+def test_trimmed_value_paths():
+    data = {
+        "return": {
+            'pkg_|-"vim"_|-vim_|-installed': {"changes": "VALUE_TRIMMED"},
+            "list": ["x", "VALUE_TRIMMED", {"a": "VALUE_TRIMMED"}],
+        },
+        "other": "VALUE_TRIMMED_NOT",
+    }
+
+    assert list(get_trimmed(data)) == [
+        '["return"]["pkg_|-\\"vim\\"_|-vim_|-installed"]["changes"]',
+        '["return"]["list"][1]',
+        '["return"]["list"][2]["a"]',
+    ]
+
+
+def test_trimmed_values_walk_is_bounded():
+    deep = "VALUE_TRIMMED"
+    for _ in range(10):
+        deep = {"x": deep}
+    data = {"deep": deep, "many": ["VALUE_TRIMMED"] * 100}
+
+    assert len(list(get_trimmed(data))) == 101
+    assert len(list(get_trimmed(data, max_depth=10))) == 100
+    assert len(list(get_trimmed(data, max_paths=5))) == 5
+
+
+def test_trimmed_values_are_not_looked_for_without_marker():
+    event_parser = EventParser({})
+    data = {
+        "fun": "test.ping",
+        "jid": "20230418100000000001",
+        "return": "VALUE_TRIMMED",
+        "_stamp": "2023-04-18T10:00:00.000000",
+    }
+    tag = "salt/job/20230418100000000001/ret/minion1"
+
+    assert event_parser.parse(tag, dict(data))["trimmed"] == ['["return"]']
+    assert "trimmed" not in event_parser.parse(tag, dict(data), trimmed=False)
+
+
+def test_state_fun_args_are_cached():
+    cache = get_state_fun_args_cache()
+    fun_args = [
+        "webserver/nginx",
+        "test=True",
+        {"pillar": {"a": [1, 2]}, "__kwarg__": True},
+    ]
+    orig = copy.deepcopy(fun_args)
+
+    parsed = parse_state_fun_args(fun_args)
+    hits = cache.hits
+    assert parse_state_fun_args(copy.deepcopy(fun_args)) is parsed
+    assert cache.hits == hits + 1
+
+    assert parsed == (("webserver.nginx",), {"test": True, "pillar": {"a": [1, 2]}})
+    assert fun_args == orig
+
+
+def test_state_fun_args_of_different_types_are_not_mixed():
+    assert parse_state_fun_args(["x", {"queue": True, "__kwarg__": True}]) == (
+        ("x",),
+        {"queue": True},
+    )
+    parsed = parse_state_fun_args(["x", {"queue": 1, "__kwarg__": True}])
+    assert parsed[1]["queue"] is not True
+
+
+def test_unhashable_state_fun_args_are_parsed():
+    fun_args = ["x", {"pillar": {"s": {1, 2}}, "__kwarg__": True}]
+
+    assert parse_state_fun_args(fun_args) == (("x",), {"pillar": {"s": {1, 2}}})
+    assert fun_args == ["x", {"pillar": {"s": {1, 2}}, "__kwarg__": True}]
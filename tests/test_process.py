@@ -0,0 +1,318 @@
+import queue
+import signal
+import threading
+
+from time import monotonic, sleep, time
+from zlib import crc32
+
+import pytest
+import salt.payload
+import salt.utils.stringutils
+
+from salt.utils.event import TAGEND
+
+from benchmarks.generator import EventsGenerator
+from saline.buffer import EventsBuffer, ShardedBatcher
+from saline.capture import EventsCaptureWriter, read_capture
+from saline.data.filter import TagFilter
+from saline.process import EventsManager, EventsReader, Saline
+
+
+BATCH_TIMEOUT = 50
+
+
+def _get_events_manager(queues):
+    events_manager = EventsManager({}, queues, queue.Queue())
+    events_manager._int_queue = EventsBuffer()
+    return events_manager
+
+
+def _get_jids(shards):
+    # Pick the jids going to the different shards
+    jids = {}
+    jid = 20230418100000000000
+    while len(jids) < shards:
+        jid += 1
+        jids.setdefault(crc32(str(jid).encode()) % shards, str(jid))
+    return [jids[shard] for shard in range(shards)]
+
+
+def _run(events_manager, tag_filter, batcher, tag, seconds):
+    # Keep the internal queue busy with the events of the tag
+    stop_at = monotonic() + seconds
+    while monotonic() < stop_at:
+        events_manager._int_queue.put((tag, {"jid": "x"}, monotonic(), False))
+        events_manager._filter_event(tag_filter, batcher)
+        sleep(0.001)
+
+
+class _FailingCapture:
+    FLUSH_INTERVAL = 1
+    path = "/capture"
+
+    def __init__(self):
+        self.closed = False
+
+    def write(self, tag, data, ts=None):
+        raise OSError(28, "No space left on device")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_capture_error_stops_capturing_only():
+    queues = [queue.Queue()]
+    events_manager = _get_events_manager(queues)
+    capture = _FailingCapture()
+    events_manager._capture = capture
+    tag_filter = TagFilter(["salt/job/.*"])
+    batcher = ShardedBatcher(queues)
+
+    for jid in ("1", "2"):
+        events_manager._int_queue.put(
+            ("salt/job/%s/new" % jid, {"jid": jid}, monotonic(), False)
+        )
+        events_manager._filter_event(tag_filter, batcher)
+
+    assert events_manager._capture is None
+    assert capture.closed
+    assert [queues[0].get_nowait()[0] for _ in range(2)] == [
+        "salt/job/1/new",
+        "salt/job/2/new",
+    ]
+
+
+def test_capture_is_closed_by_filter_thread(tmp_path):
+    queues = [queue.Queue()]
+    capture_file = str(tmp_path / "events.capture")
+    events_manager = EventsManager(
+        {"events_regex_filter": "salt/job/.*", "events_capture_file": capture_file},
+        queues,
+        queue.Queue(),
+    )
+    events_manager._int_queue = EventsBuffer()
+    events_manager._int_queue_thread = threading.Thread(
+        target=events_manager.process_events
+    )
+    events_manager._int_queue_thread.start()
+    events_manager.enqueue("salt/job/1/new", {"jid": "1"})
+    queues[0].get(timeout=5)
+
+    with pytest.raises(SystemExit):
+        events_manager._handle_signals(signal.SIGTERM, None)
+
+    assert not events_manager._int_queue_thread.is_alive()
+    assert events_manager._capture is None
+    assert [tag for _, tag, _ in read_capture(capture_file)] == ["salt/job/1/new"]
+
+
+def test_capture_keeps_receive_time(tmp_path):
+    queues = [queue.Queue()]
+    events_manager = _get_events_manager(queues)
+    capture_file = str(tmp_path / "events.capture")
+    events_manager._capture = EventsCaptureWriter(capture_file)
+    tag_filter = TagFilter(["salt/job/.*"])
+    batcher = ShardedBatcher(queues)
+
+    # The events were waiting in the queue for 5 and 2 seconds
+    for tag, waited in (("salt/job/1/new", 5), ("salt/job/2/new", 2)):
+        events_manager._int_queue.put((tag, {"jid": "1"}, monotonic() - waited, False))
+    events_manager._filter_event(tag_filter, batcher)
+    events_manager._filter_event(tag_filter, batcher)
+    events_manager._capture.close()
+
+    (ts1, _, _), (ts2, _, _) = read_capture(capture_file)
+    assert time() - 5.5 < ts1 < time() - 4.5
+    assert ts2 - ts1 == pytest.approx(3, abs=0.1)
+
+
+def test_hot_shard_does_not_delay_other_shards():
+    queues = [queue.Queue(), queue.Queue()]
+    events_manager = _get_events_manager(queues)
+    tag_filter = TagFilter(["salt/job/.*"])
+    batcher = ShardedBatcher(queues, batch_size=1000, batch_timeout=BATCH_TIMEOUT)
+    hot_jid, cold_jid = _get_jids(2)
+
+    events_manager._int_queue.put(
+        ("salt/job/%s/new" % cold_jid, {"jid": cold_jid}, monotonic(), False)
+    )
+    events_manager._filter_event(tag_filter, batcher)
+    _run(
+        events_manager,
+        tag_filter,
+        batcher,
+        "salt/job/%s/new" % hot_jid,
+        BATCH_TIMEOUT * 3 / 1000,
+    )
+
+    batch = queues[1].get_nowait()
+    assert [tag for tag, _, _ in batch] == ["salt/job/%s/new" % cold_jid]
+
+
+def test_filtered_out_events_do_not_delay_batch():
+    queues = [queue.Queue()]
+    events_manager = _get_events_manager(queues)
+    tag_filter = TagFilter(["salt/job/.*"])
+    batcher = ShardedBatcher(queues, batch_size=1000, batch_timeout=BATCH_TIMEOUT)
+
+    events_manager._int_queue.put(
+        ("salt/job/1/new", {"jid": "1"}, monotonic(), False)
+    )
+    events_manager._filter_event(tag_filter, batcher)
+    _run(
+        events_manager,
+        tag_filter,
+        batcher,
+        "salt/beacon/minion/inotify",
+        BATCH_TIMEOUT * 3 / 1000,
+    )
+
+    batch = queues[0].get_nowait()
+    assert [tag for tag, _, _ in batch] == ["salt/job/1/new"]
+
+
+class _FakeProcess:
+    def __init__(self):
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+
+class _FakeProcessManager:
+    def __init__(self):
+        self._process_map = {}
+        self._pid = 0
+
+    def add_process(self, tgt, args=None, kwargs=None):
+        self._pid += 1
+        process = _FakeProcess()
+        self._process_map[self._pid] = {
+            "tgt": tgt,
+            "args": args,
+            "kwargs": kwargs,
+            "Process": process,
+        }
+        return process
+
+
+def test_retired_reader_index_is_not_reused_while_alive():
+    saline = Saline(
+        {
+            "readers_subprocesses": 2,
+            "readers_autoscale": True,
+            "readers_min": 1,
+            "readers_max": 2,
+            "readers_scale_up_backlog": 1,
+        }
+    )
+    saline.req_queue = queue.Queue()
+    saline.ret_queue = queue.Queue()
+    saline.process_manager = _FakeProcessManager()
+    saline._start_reader(0)
+    saline._start_reader(1)
+
+    saline._retire_reader(1)
+    retired = saline._readers_retired[1]
+    assert saline._readers_stop[1] == 1
+    assert [
+        mapping["args"][3]
+        for mapping in saline.process_manager._process_map.values()
+        if mapping["tgt"] is EventsReader
+    ] == [0]
+
+    for _ in range(10):
+        saline.req_queue.put(None)
+    saline.autoscale_readers()
+    # The retired reader is still finishing the batch with the stop flag set
+    assert list(saline._readers) == [0]
+    assert saline._readers_stop[1] == 1
+
+    retired.alive = False
+    saline.autoscale_readers()
+    assert sorted(saline._readers) == [0, 1]
+    assert saline._readers_stop[1] == 0
+    assert saline._readers_retired == {}
+
+
+def test_autoscaling_counts_batched_events():
+    saline = Saline(
+        {
+            "readers_autoscale": True,
+            "readers_min": 1,
+            "readers_max": 2,
+            "readers_scale_up_backlog": 50,
+            "readers_scale_down_backlog": 10,
+            "readers_scale_down_after": 0,
+            "events_batch_size": 100,
+        }
+    )
+    saline.req_queue = queue.Queue()
+    saline.ret_queue = queue.Queue()
+    saline.process_manager = _FakeProcessManager()
+    saline._start_reader(0)
+
+    # One full batch is above the backlog to add the reader on
+    saline.req_queue.put([None] * 100)
+    saline.autoscale_readers()
+    assert sorted(saline._readers) == [0, 1]
+
+    # The same batch is above the backlog to retire the reader on as well
+    saline.req_queue.put([None] * 100)
+    saline.autoscale_readers()
+    saline.autoscale_readers()
+    assert sorted(saline._readers) == [0, 1]
+
+
+def test_backlog_counts_batched_events():
+    queues = [queue.Queue(), queue.Queue()]
+    ret_queue = queue.Queue()
+    events_manager = EventsManager({"events_batch_size": 10}, queues, ret_queue)
+    events_manager._int_queue = EventsBuffer()
+    events_manager._int_queue.put(("salt/auth", {}, monotonic(), False))
+    queues[0].put([None] * 10)
+    queues[1].put([None] * 10)
+    ret_queue.put([None] * 10)
+
+    assert events_manager._get_backlog() == 31
+
+
+def _get_forwarded(raw_forwarding, raws):
+    events_manager = EventsManager(
+        {"events_raw_forwarding": raw_forwarding}, [queue.Queue()], queue.Queue()
+    )
+    events_manager._int_queue = EventsBuffer()
+    for raw in raws:
+        events_manager.enqueue_event(raw)
+    return [events_manager._int_queue.get(timeout=1) for _ in raws]
+
+
+def test_raw_payloads_are_parsed_as_decoded_events():
+    events = list(
+        EventsGenerator(minions=3, states=10, jobs=2, trimmed_ratio=0.2).events()
+    )
+    tagend = salt.utils.stringutils.to_bytes(TAGEND)
+    raws = [
+        salt.utils.stringutils.to_bytes(tag)
+        + tagend
+        + salt.payload.dumps(data, use_bin_type=True)
+        for tag, data in events
+    ]
+    events_reader = EventsReader({}, queue.Queue(), queue.Queue(), 0)
+
+    parsed = []
+    for tag, data, _, trimmed in _get_forwarded(False, raws):
+        parsed.append(events_reader.event_parser.parse(tag, data, trimmed=trimmed))
+    parsed_raw = []
+    for tag, payload, _, _ in _get_forwarded(True, raws):
+        # The same as the Events Reader does with the forwarded payloads
+        assert isinstance(payload, bytes)
+        trimmed = b"VALUE_TRIMMED" in payload
+        data = events_reader.decode_payload(tag, payload)
+        parsed_raw.append(events_reader.event_parser.parse(tag, data, trimmed=trimmed))
+
+    assert any(p is not None and p.get("trimmed") for p in parsed)
+    assert parsed_raw == parsed
@@ -0,0 +1,57 @@
+import re
+
+from saline.data.rename import RenameRules
+
+
+RULES = {
+    r"pkg_\d+$": "pkg_*",
+    r"pkg_(\w+)_minion\d+": "pkg_*_minion*",
+    r"services/web_\d+\.conf": "services/web_*.conf",
+    r"(?i)USERS\.user_[a-j]+": "users.user_*",
+    r"util\.sync_(1|2)\d*": "util.sync_*",
+    r"cron\.job_.*": "cron.job_*",
+}
+
+VALUES = [
+    "pkg_1",
+    "pkg_1x",
+    "pkg_abc_minion00001",
+    "pkg_12_minion00002.example.org",
+    "services/web_1.conf",
+    "services/web_x.conf",
+    "users.user_abcdef",
+    "users.user_xyz",
+    "util.sync_12",
+    "util.sync_3",
+    "cron.job_1_2",
+    "cron",
+    "",
+]
+
+
+def _rename(rules, value):
+    for pattern, replacement in rules.items():
+        if re.match(pattern, value):
+            return replacement
+    return None
+
+
+def test_combined_rules_match_the_rules_one_by_one():
+    rename_rules = RenameRules(RULES)
+
+    for value in VALUES * 2:
+        assert rename_rules.rename(value) == _rename(RULES, value), value
+
+
+def test_first_matching_rule_wins():
+    rules = {r"pkg_.*": "first", r"pkg_\d+": "second"}
+
+    assert RenameRules(rules).rename("pkg_1") == "first"
+
+
+def test_rules_with_backreferences():
+    rules = {r"(\w+)_\1$": "twice", r"\w+_\w+": "pair"}
+    rename_rules = RenameRules(rules)
+
+    for value in ("ab_ab", "ab_cd", "ab"):
+        assert rename_rules.rename(value) == _rename(rules, value), value
@@ -0,0 +1,88 @@
+import multiprocessing
+import sys
+
+from queue import Empty as QueueEmpty, Full as QueueFull
+from time import monotonic
+
+import pytest
+
+from salt.exceptions import SaltConfigurationError
+
+from saline.process import Saline
+
+shm = pytest.importorskip("saline.shm")
+
+
+@pytest.fixture
+def shm_queue():
+    queue = shm.SharedMemoryQueue(256)
+    yield queue
+    queue.close()
+
+
+def test_records_wrap_around_the_ring_buffer(shm_queue):
+    # The records of the different sizes are crossing the end of the buffer
+    for i in range(100):
+        item = ("x" * (i % 37), i)
+        shm_queue.put(item)
+        assert shm_queue.qsize() == 1
+        assert shm_queue.get(timeout=1) == item
+    assert shm_queue.empty()
+    assert shm_queue.fill() == 0
+
+
+def test_put_raises_full_after_timeout(shm_queue):
+    count = 0
+    with pytest.raises(QueueFull):
+        while True:
+            shm_queue.put("x" * 50, block=False)
+            count += 1
+    started = monotonic()
+    with pytest.raises(QueueFull):
+        shm_queue.put("x" * 50, timeout=0.2)
+
+    assert monotonic() - started >= 0.2
+    # Getting the record frees the space for the next one
+    assert shm_queue.get(timeout=1) == "x" * 50
+    shm_queue.put("x" * 50, timeout=0.2)
+    assert shm_queue.qsize() == count
+
+
+def test_get_raises_empty_after_timeout(shm_queue):
+    with pytest.raises(QueueEmpty):
+        shm_queue.get(timeout=0.01)
+
+
+def test_too_large_record_is_rejected(shm_queue):
+    with pytest.raises(ValueError):
+        shm_queue.put("x" * 512)
+
+
+def _produce(queue, producer, count):
+    for i in range(count):
+        queue.put((producer, i))
+
+
+def test_producers_records_keep_their_order(shm_queue):
+    ctx = multiprocessing.get_context("fork")
+    producers = [
+        ctx.Process(target=_produce, args=(shm_queue, producer, 200))
+        for producer in range(3)
+    ]
+    for process in producers:
+        process.start()
+    # The buffer fits only a few records, so the producers wait for the space
+    items = [shm_queue.get(timeout=10) for _ in range(600)]
+    for process in producers:
+        process.join(10)
+
+    for producer in range(3):
+        assert [i for p, i in items if p == producer] == list(range(200))
+
+
+def test_shm_transport_requires_shared_memory(monkeypatch):
+    # The import fails the same way on Python 3.6 and 3.7
+    monkeypatch.setitem(sys.modules, "saline.shm", None)
+
+    with pytest.raises(SaltConfigurationError):
+        Saline({"transport": "shm"})
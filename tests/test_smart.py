@@ -0,0 +1,55 @@
+import pytest
+
+from benchmarks.smart import get_values
+from saline.data.smart import SmartMerger
+
+
+class BruteForceMerger(SmartMerger):
+    """
+    The merger comparing all of the pairs of the values
+    """
+
+    def _get_candidates(self, items):
+        return {
+            j: [i for i in range(len(items)) if i != j] for j in range(len(items))
+        }
+
+
+def _get_rules(cls, values, **kwargs):
+    smart_merger = cls(len(values) // 2, data=dict.fromkeys(values), **kwargs)
+    # The second call is checked too as it skips the known replacements
+    return [
+        [(pattern.pattern, replacement) for pattern, replacement in rules or []]
+        for rules in (smart_merger.get_new_rules(), smart_merger.get_new_rules())
+    ]
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("match_quality", [0.3, 0.7])
+@pytest.mark.parametrize("match_len_trashold", [2, 3, 4])
+def test_candidates_find_the_same_rules_as_all_pairs(
+    seed, match_quality, match_len_trashold
+):
+    values = get_values(40, seed=seed)
+    kwargs = {
+        "match_quality": match_quality,
+        "match_len_trashold": match_len_trashold,
+    }
+
+    assert _get_rules(SmartMerger, values, **kwargs) == _get_rules(
+        BruteForceMerger, values, **kwargs
+    )
+
+
+def test_values_sharing_the_prefix_find_the_same_rules_as_all_pairs():
+    # All of the values of the same format share the most of their q-grams,
+    # so each of them is a candidate to compare with all of the others
+    values = [
+        "custom.generated_%05d_%s" % (i, kind)
+        for i in range(30)
+        for kind in ("web", "db", "cache")
+    ]
+    rules = _get_rules(SmartMerger, values)
+
+    assert rules == _get_rules(BruteForceMerger, values)
+    assert rules[0][0] == ("custom\\.generated_000.*", "custom.generated_000*")
@@ -0,0 +1,40 @@
+from threading import Lock
+
+from saline.data.state import StateResultsRegistry
+
+
+def _get_labels(count):
+    return [
+        ("top", "pkg_%d_minion%03d" % (i % 5, i), "pkg.installed", "succeeded")
+        for i in range(count)
+    ]
+
+
+def test_deferred_merging_is_done_by_merge_pending():
+    moved = []
+    registry = StateResultsRegistry(
+        sid_merging_on=20,
+        move_callback=lambda src, dst: moved.append((src, dst)),
+        merge_deferred=True,
+    )
+    labels = _get_labels(100)
+    # The new values are kept as they are until the merging pass
+    assert [registry.get(lv) for lv in labels] == labels
+    assert len(registry) == 100
+    assert moved == []
+
+    assert registry.merge_pending(Lock()) == 0
+    assert 0 < len(registry) <= 20
+    merged = {src: dst for src, dst in moved}
+    for lv in labels:
+        assert registry.get(lv) == merged.get(lv, lv)
+    assert len(registry) <= 20
+
+
+def test_merging_on_adding_values():
+    registry = StateResultsRegistry(sid_merging_on=20)
+    for lv in _get_labels(100):
+        registry.get(lv)
+
+    assert len(registry) <= 20
+    assert registry.merge_pending(Lock()) == 0